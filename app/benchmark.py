@@ -0,0 +1,94 @@
+"""
+Concurrency benchmark for POST /api/signup: the previous blocking handler
+(sync supabase client in a `def` route, i.e. FastAPI's threadpool) against
+the async client now used by app.main.
+
+Starts fake_postgrest on a local port, so no Supabase project is needed:
+
+    python -m app.benchmark --requests 2000 --concurrency 200 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+import httpx
+import uvicorn
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_fake_postgrest(latency_ms: float) -> str:
+    import fake_postgrest
+
+    fake_postgrest.config.latency_ms = latency_ms
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(fake_postgrest.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+def blocking_app(url: str, key: str):
+    """The handler as it was before: sync client, sync route"""
+    from fastapi import FastAPI
+    from supabase import create_client
+    from app.main import SignupRequest
+
+    legacy = FastAPI()
+    supabase = create_client(url, key)
+
+    @legacy.post("/api/signup")
+    def signup(user: SignupRequest):
+        response = supabase.table("users").insert({
+            "full_name": user.full_name,
+            "username": user.username,
+            "email": user.email,
+            "password": user.password,
+            "phone_number": user.phone_number
+        }).execute()
+        return {"message": "User created successfully", "data": response.data}
+
+    return legacy
+
+async def run_load(app, total: int, concurrency: int, prefix: str) -> dict:
+    counter = iter(range(total))
+    errors = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for i in counter:
+            response = await client.post("/api/signup", json={
+                "full_name": f"User {i}", "username": f"{prefix}{i}",
+                "email": f"{prefix}{i}@example.com", "password": "Password1",
+            })
+            errors += response.status_code != 200
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app", timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"requests": total, "errors": errors, "seconds": round(elapsed, 2), "rps": round(total / elapsed, 1)}
+
+async def main(args):
+    url = start_fake_postgrest(args.latency_ms)
+    key = "fake-key"
+    os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"] = url, key
+
+    import app.database
+    app.database.SUPABASE_URL, app.database.SUPABASE_KEY = url, key
+    from app.main import app as async_app
+
+    print("blocking:", await run_load(blocking_app(url, key), args.requests, args.concurrency, "sync"))
+    print("async:   ", await run_load(async_app, args.requests, args.concurrency, "async"))
+    await app.database.close_supabase()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    asyncio.run(main(parser.parse_args()))
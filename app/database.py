@@ -1,4 +1,5 @@
-from supabase import create_client
+from typing import Optional
+from supabase import acreate_client, AsyncClient
 from dotenv import load_dotenv
 import os
 
@@ -7,4 +8,19 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+# One async client per process: queries await the network instead of
+# blocking the event loop or occupying a threadpool worker
+_supabase: Optional[AsyncClient] = None
+
+async def get_supabase() -> AsyncClient:
+    """Return the shared client (created in the app lifespan, or lazily)"""
+    global _supabase
+    if _supabase is None:
+        _supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+async def close_supabase():
+    global _supabase
+    if _supabase is not None:
+        await _supabase.postgrest.aclose()
+        _supabase = None
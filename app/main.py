@@ -1,10 +1,22 @@
-from fastapi import FastAPI, HTTPException
+import hmac
+import io
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from supabase import create_client, Client
-import os
+from app.database import get_supabase, close_supabase
+from app.user_import import FORMATS, IMPORT_API_KEY, import_report
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await get_supabase()
+    yield
+    await close_supabase()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend to access backend
 app.add_middleware(
@@ -15,12 +27,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load environment variables
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # Request model for signup
 class SignupRequest(BaseModel):
     full_name: str
@@ -30,9 +36,10 @@ class SignupRequest(BaseModel):
     phone_number: str = None  # Optional field
 
 @app.post("/api/signup")
-def signup(user: SignupRequest):
+async def signup(user: SignupRequest):
+    supabase = await get_supabase()
     try:
-        response = supabase.table("users").insert({
+        response = await supabase.table("users").insert({
             "full_name": user.full_name,
             "username": user.username,
             "email": user.email,
@@ -44,4 +51,27 @@ def signup(user: SignupRequest):
 
     except Exception as e:
         print("Signup error:", e)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/users/import")
+async def import_users(request: Request, format: str = "csv", x_import_key: Optional[str] = Header(None)):
+    if not IMPORT_API_KEY or not hmac.compare_digest(x_import_key or "", IMPORT_API_KEY):
+        raise HTTPException(status_code=403, detail="Import not allowed")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+
+    # Spool the body to disk as it arrives, then import it batch by batch
+    upload = tempfile.TemporaryFile()
+    async for chunk in request.stream():
+        upload.write(chunk)
+    upload.seek(0)
+    text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+
+    async def report():
+        try:
+            async for line in import_report(text, format):
+                yield line
+        finally:
+            text.close()
+
+    return StreamingResponse(report(), media_type="application/x-ndjson")
@@ -1,18 +1,20 @@
 from fastapi import APIRouter
-from app.database import supabase
+from postgrest.exceptions import APIError
+from app.database import get_supabase
 from app.models import SignupData
 
 router = APIRouter()
 
 @router.post("/signup")
-def signup(data: SignupData):
-    result = supabase.table("users").insert({
-        "name": data.name,
-        "email": data.email,
-        "password": data.password
-    }).execute()
-
-    if result.error:
-        return {"status": "error", "message": str(result.error)}
+async def signup(data: SignupData):
+    supabase = await get_supabase()
+    try:
+        await supabase.table("users").insert({
+            "name": data.name,
+            "email": data.email,
+            "password": data.password
+        }).execute()
+    except APIError as e:
+        return {"status": "error", "message": str(e)}
 
     return {"status": "success", "message": "User created"}
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+Streaming bulk import of user accounts from CSV (with a header row) or NDJSON.
+
+    python -m app.user_import staff.csv --report errors.ndjson
+
+Rows are read, validated, hashed and inserted one batch at a time, so memory
+stays flat however large the file is; only a compact hash per seen
+email/username is kept to catch duplicates inside the file. Rejected rows
+are reported one NDJSON line each, followed by a summary line.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, Optional, TextIO
+import bcrypt
+from postgrest import ReturnMethod
+from postgrest.exceptions import APIError
+from app.database import get_supabase, close_supabase
+from app.utils import validate_email, validate_password, sanitize_string
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# bcrypt releases the GIL, so hashing a batch scales with the worker count
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", str(os.cpu_count() or 1)))
+IMPORT_BCRYPT_ROUNDS = int(os.getenv("IMPORT_BCRYPT_ROUNDS", "12"))
+# Required in the X-Import-Key header of POST /api/users/import; the endpoint is off when unset
+IMPORT_API_KEY = os.getenv("IMPORT_API_KEY")
+
+USERS_TABLE = "users"
+FORMATS = ("csv", "ndjson")
+IMPORT_ROLES = ("customer", "staff")
+UNIQUE_VIOLATION = "23505"
+
+_hash_executor: Optional[ThreadPoolExecutor] = None
+
+def read_records(text: TextIO, fmt: str) -> Iterator[tuple]:
+    """Yield (line_number, record) pairs; malformed NDJSON lines give a None record"""
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+def _text(value) -> str:
+    return sanitize_string(value if isinstance(value, str) else str(value)) if value is not None else ""
+
+def validate_record(record) -> tuple:
+    """Return (row, None) for a valid record or (None, error)"""
+    if not isinstance(record, dict):
+        return None, "Malformed record"
+    row = {
+        "full_name": _text(record.get("full_name") or record.get("name")),
+        "username": _text(record.get("username")),
+        "email": _text(record.get("email")),
+        "password": record.get("password") if isinstance(record.get("password"), str) else "",
+        "phone_number": _text(record.get("phone_number")) or None,
+        "role": _text(record.get("role")) or "customer",
+    }
+    missing = [field for field in ("full_name", "username", "email", "password") if not row[field]]
+    if missing:
+        return None, f"Missing {', '.join(missing)}"
+    if not validate_email(row["email"]):
+        return None, "Invalid email"
+    if not validate_password(row["password"]):
+        return None, "Password must be at least 8 characters with an uppercase letter, a lowercase letter and a digit"
+    if len(row["password"].encode()) > 72:
+        return None, "Password is longer than 72 bytes"
+    if row["role"] not in IMPORT_ROLES:
+        return None, f"Role must be one of {', '.join(IMPORT_ROLES)}"
+    return row, None
+
+def _dedup_key(field: str, value: str) -> int:
+    # 8 bytes per value instead of the full string
+    return int.from_bytes(hashlib.blake2b(f"{field}:{value.lower()}".encode(), digest_size=8).digest(), "little")
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(IMPORT_BCRYPT_ROUNDS)).decode()
+
+async def _hash_passwords(rows: list):
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(max_workers=IMPORT_HASH_WORKERS, thread_name_prefix="import-bcrypt")
+    loop = asyncio.get_running_loop()
+    hashes = await asyncio.gather(*(loop.run_in_executor(_hash_executor, _hash, row["password"]) for _, row in rows))
+    for (_, row), hashed in zip(rows, hashes):
+        row["password"] = hashed
+
+def _insert_error(error: APIError) -> str:
+    if error.code == UNIQUE_VIOLATION:
+        return "User with this email or username already exists"
+    return error.message or str(error)
+
+async def _insert(supabase, rows: list) -> list:
+    """
+    Insert (line, row) pairs in one request and return (line, error) for the
+    rows that were rejected. A failing chunk is split in half until the
+    offending rows are isolated.
+    """
+    try:
+        await supabase.table(USERS_TABLE).insert([row for _, row in rows], returning=ReturnMethod.minimal).execute()
+        return []
+    except APIError as e:
+        if len(rows) == 1:
+            return [(rows[0][0], _insert_error(e))]
+        middle = len(rows) // 2
+        return await _insert(supabase, rows[:middle]) + await _insert(supabase, rows[middle:])
+
+def _batches(records: Iterable[tuple], size: int) -> Iterator[list]:
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def import_users(records: Iterable[tuple], batch_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """
+    Import (line_number, record) pairs. Yields {"line", "error"} for every
+    rejected row and finally {"summary": {...}}. The insert of one batch
+    overlaps with validating and hashing the next.
+    """
+    supabase = await get_supabase()
+    seen = set()
+    summary = {"rows": 0, "imported": 0, "invalid": 0, "duplicates": 0, "failed": 0}
+    pending = None
+
+    async def finish(task):
+        for line, error in await task:
+            summary["imported"] -= 1
+            summary["failed"] += 1
+            yield {"line": line, "error": error}
+
+    for batch in _batches(records, batch_size):
+        valid = []
+        for line, record in batch:
+            summary["rows"] += 1
+            row, error = validate_record(record)
+            if error:
+                summary["invalid"] += 1
+                yield {"line": line, "error": error}
+                continue
+            keys = (_dedup_key("email", row["email"]), _dedup_key("username", row["username"]))
+            if keys[0] in seen or keys[1] in seen:
+                summary["duplicates"] += 1
+                yield {"line": line, "error": "Duplicate email or username in this import"}
+                continue
+            seen.update(keys)
+            valid.append((line, row))
+
+        await _hash_passwords(valid)
+        if pending is not None:
+            async for entry in finish(pending):
+                yield entry
+            pending = None
+        if valid:
+            summary["imported"] += len(valid)
+            pending = asyncio.ensure_future(_insert(supabase, valid))
+
+    if pending is not None:
+        async for entry in finish(pending):
+            yield entry
+    yield {"summary": summary}
+
+async def import_report(text: TextIO, fmt: str, batch_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """The import report as NDJSON lines"""
+    async for entry in import_users(read_records(text, fmt), batch_size):
+        yield (json.dumps(entry) + "\n").encode()
+
+def detect_format(path: str) -> str:
+    return "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+
+async def main(args):
+    fmt = args.format or detect_format(args.path)
+    report = open(args.report, "wb") if args.report else sys.stdout.buffer
+    try:
+        with open(args.path, encoding="utf-8-sig", newline="") as text:
+            async for line in import_report(text, fmt, args.batch_size):
+                report.write(line)
+                report.flush()
+    finally:
+        if args.report:
+            report.close()
+        await close_supabase()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import users from CSV or NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+    parser.add_argument("--report", help="Write the NDJSON error report here instead of stdout")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    asyncio.run(main(parser.parse_args()))
@@ -2,20 +2,25 @@ import re
 from typing import Optional
 from datetime import datetime
 
+# Compiled once at import; the validators run per row during bulk imports
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+UPPERCASE_PATTERN = re.compile(r'[A-Z]')
+LOWERCASE_PATTERN = re.compile(r'[a-z]')
+DIGIT_PATTERN = re.compile(r'\d')
+
 def validate_email(email: str) -> bool:
     """Validate email format"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return EMAIL_PATTERN.match(email) is not None
 
 def validate_password(password: str) -> bool:
     """Validate password strength (at least 8 characters, 1 uppercase, 1 lowercase, 1 digit)"""
     if len(password) < 8:
         return False
-    if not re.search(r'[A-Z]', password):
+    if not UPPERCASE_PATTERN.search(password):
         return False
-    if not re.search(r'[a-z]', password):
+    if not LOWERCASE_PATTERN.search(password):
         return False
-    if not re.search(r'\d', password):
+    if not DIGIT_PATTERN.search(password):
         return False
     return True
 
@@ -27,4 +32,4 @@ def format_datetime(dt: Optional[datetime]) -> Optional[str]:
 
 def sanitize_string(text: str) -> str:
     """Basic string sanitization"""
-    return text.strip() if text else "" 
\ No newline at end of file
+    return text.strip() if text else "" 
@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from utils.db_metrics import InstrumentedPool, instrument
 
 # Load environment variables
 load_dotenv()
@@ -30,32 +31,81 @@ if not DATABASE_URL:
 
 print(f"🔗 Connecting to database: {DATABASE_URL.split('@')[0]}@***" if '@' in DATABASE_URL else DATABASE_URL)
 
+# Connection pool settings (PostgreSQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+# Set to 0 behind Supabase's transaction-mode pooler (pgbouncer), which
+# does not support prepared statements
+DB_STATEMENT_CACHE_SIZE = os.getenv("DB_STATEMENT_CACHE_SIZE")
+
+def async_database_url(url: str) -> str:
+    """Point a plain database URL at its async driver (asyncpg / aiosqlite)"""
+    scheme, _, rest = url.partition("://")
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+        return f"postgresql+asyncpg://{rest}"
+    if scheme == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
 # Create SQLAlchemy engine
-if DATABASE_URL.startswith("postgresql"):
+if DATABASE_URL.startswith("postgres"):
     # PostgreSQL configuration for Supabase
-    engine = create_engine(
-        DATABASE_URL,
+    connect_args = {}
+    # Empty (as in env.example) keeps the asyncpg default
+    if DB_STATEMENT_CACHE_SIZE:
+        connect_args["statement_cache_size"] = int(DB_STATEMENT_CACHE_SIZE)
+    engine = create_async_engine(
+        async_database_url(DATABASE_URL),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
         pool_pre_ping=True,
-        pool_recycle=300,
+        poolclass=InstrumentedPool,
+        connect_args=connect_args,
         echo=False  # Set to True for SQL debugging
     )
 else:
     # SQLite configuration (fallback)
-    engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False}
-    )
+    engine = create_async_engine(async_database_url(DATABASE_URL), poolclass=InstrumentedPool)
+
+# Pool checkout and statement timings, served on /metrics
+instrument(engine)
 
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create SessionLocal class. Objects stay loaded after commit: with async
+# sessions an expired attribute cannot be lazily reloaded on access.
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Create Base class
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
+
+def _create_missing_indexes(connection):
+    # create_all skips tables that already exist, and with them any index added to the model later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def _add_missing_columns(connection):
+    # Likewise for nullable columns added to a model later
+    existing = inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        present = {column["name"] for column in existing.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in present and column.nullable:
+                connection.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(connection.dialect)}"
+                ))
+
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
@@ -1,15 +1,38 @@
-from fastapi import FastAPI
+import hmac
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from database import engine, Base
-from routers import auth, menu, order
+from database import engine, SessionLocal, create_tables
+from routers import auth, menu, order, report
+from utils.auth import verified_tokens, current_users
+from utils.hashing import hash_pool
+from utils.menu_version import http_stats as menu_http_stats
+from utils.db_metrics import db_metrics, count_statements
+from utils.order_feed import order_feed
+
+# /metrics includes SQL fingerprints and handler names; sent as X-Metrics-Key,
+# leave unset to disable the endpoint
+METRICS_API_KEY = os.getenv("METRICS_API_KEY")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_tables()
+    # Load the menu snapshot before serving traffic
+    async with SessionLocal() as db:
+        await menu.menu_store.load(db)
+    yield
+    await engine.dispose()
 
 app = FastAPI(
     title="Mexican Restaurant API",
     description="API for Mexican Restaurant management system",
     version="1.0.0",
+    lifespan=lifespan,
     debug=True  # Enable debug mode
 )
 
@@ -20,15 +43,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Count the SQL statements each route runs (see /metrics)
+app.middleware("http")(count_statements)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(menu.router, prefix="/api/menu", tags=["Menu"])
 app.include_router(order.router, prefix="/api/orders", tags=["Orders"])
+app.include_router(report.router, prefix="/api/reports", tags=["Reports"])
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request, exc):
@@ -52,6 +77,19 @@ async def root():
         "documentation": "/docs",
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(x_metrics_key: Optional[str] = Header(None)):
+    if not METRICS_API_KEY or not hmac.compare_digest(x_metrics_key or "", METRICS_API_KEY):
+        raise HTTPException(status_code=403, detail="Metrics not available")
+    return {
+        "password_hashing": hash_pool.stats(),
+        "verified_tokens": verified_tokens.stats(),
+        "current_users": current_users.stats(),
+        "menu": {**menu.menu_store.stats(), **menu_http_stats.stats()},
+        "database": db_metrics.stats(),
+        "order_feed": order_feed.stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=5001, reload=True) 
\ No newline at end of file
@@ -39,4 +39,11 @@ class MenuCategory(Base):
     name = Column(String, unique=True, index=True)
     description = Column(String, nullable=True)
     image_url = Column(String, nullable=True)
-    display_order = Column(Integer, default=0) 
\ No newline at end of file
+    display_order = Column(Integer, default=0)
+
+class MenuState(Base):
+    """Single row whose version is bumped by every menu write, shared by all workers"""
+    __tablename__ = "menu_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
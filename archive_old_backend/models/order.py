@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Enum, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, Enum, ForeignKey, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
@@ -43,6 +43,9 @@ class Order(Base):
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order")
 
+    # Supports keyset pagination of order listings (newest first)
+    __table_args__ = (Index("ix_orders_created_at_id", "created_at", "id"),)
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
@@ -53,6 +56,8 @@ class OrderItem(Base):
     unit_price = Column(Float)
     total_price = Column(Float)
     special_instructions = Column(String, nullable=True)
+    # Menu category when ordered, so sales stay booked where they were placed if the item moves
+    category = Column(String, nullable=True)
     
     # Relationships
     order = relationship("Order", back_populates="items")
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, UniqueConstraint
+from database import Base
+
+class SalesRollup(Base):
+    """
+    Sales per hour for one reporting dimension (menu item, category or
+    payment method), kept up to date by the order handlers
+    """
+    __tablename__ = "sales_rollups"
+
+    id = Column(Integer, primary_key=True)
+    hour = Column(DateTime, nullable=False)
+    dimension = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    orders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    paid_orders = Column(Integer, nullable=False, default=0)
+    paid_revenue = Column(Float, nullable=False, default=0)
+
+    # Target of the incremental upserts, and the index reports read through
+    __table_args__ = (UniqueConstraint("dimension", "hour", "key", name="uq_sales_rollups_dimension_hour_key"),)
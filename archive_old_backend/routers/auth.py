@@ -1,17 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Optional
 from database import get_db
 from models.user import User, UserRole
 from utils.auth import (
-    verify_password,
-    get_password_hash,
-    create_access_token,
+    create_user_token,
     get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from utils.hashing import hash_password, verify_and_update_password
 from pydantic import BaseModel, EmailStr, ConfigDict
 
 router = APIRouter()
@@ -38,16 +38,16 @@ class UserResponse(BaseModel):
     role: UserRole
 
 @router.post("/signup", response_model=UserResponse)
-async def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if username already exists
-    if db.query(User).filter(User.username == user.username).first():
+    if await db.scalar(select(User.id).where(User.username == user.username).limit(1)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
     # Check if email already exists
-    if db.query(User).filter(User.email == user.email).first():
+    if await db.scalar(select(User.id).where(User.email == user.email).limit(1)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -57,40 +57,44 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
     db_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=await hash_password(user.password),
         full_name=user.full_name,
         phone_number=user.phone_number,
         role=UserRole.CUSTOMER  # Default role for new users
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/token", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Find user by username
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.username == form_data.username).limit(1))
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Upgrade the stored hash if the bcrypt cost has changed
+    if new_hash:
+        user.hashed_password = new_hash
+    
     # Update last login
     user.last_login = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username},
-        expires_delta=access_token_expires
-    )
+    access_token = create_user_token(user, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
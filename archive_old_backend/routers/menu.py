@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from database import get_db
 from models.menu import MenuItem, MenuCategory, Category, SpiceLevel
 from models.user import User, UserRole
-from utils.auth import get_current_user
+from utils.auth import get_current_principal, Principal
+from utils.menu_version import bump_version, cached_response
+from utils.menu_snapshot import MenuStore
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 
@@ -48,8 +51,16 @@ class MenuCategoryResponse(MenuCategoryBase):
     model_config = ConfigDict(from_attributes=True)
     id: int
 
+# Menu reads are served from an in-memory snapshot, reloaded after writes
+# and whenever another worker has bumped the shared menu version
+menu_store = MenuStore(MenuItemResponse, MenuCategoryResponse)
+
+async def commit_menu_write(db: AsyncSession):
+    await bump_version(db)
+    await db.commit()
+
 # Helper function to check if user is admin
-async def is_admin(user: User = Depends(get_current_user)):
+async def is_admin(user: Principal = Depends(get_current_principal)):
     if user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -60,133 +71,139 @@ async def is_admin(user: User = Depends(get_current_user)):
 # Menu Items endpoints
 @router.get("/items", response_model=List[MenuItemResponse])
 async def get_menu_items(
+    request: Request,
     category: Optional[Category] = None,
     is_vegetarian: Optional[bool] = None,
     is_available: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(MenuItem)
-    
-    if category:
-        query = query.filter(MenuItem.category == category)
-    if is_vegetarian is not None:
-        query = query.filter(MenuItem.is_vegetarian == is_vegetarian)
-    if is_available is not None:
-        query = query.filter(MenuItem.is_available == is_available)
-    
-    return query.all()
+    snapshot = await menu_store.current(db)
+    body, etag = snapshot.items_response(category, is_vegetarian, is_available)
+    return cached_response(request, body, etag)
 
 @router.get("/items/{item_id}", response_model=MenuItemResponse)
-async def get_menu_item(item_id: int, db: Session = Depends(get_db)):
-    item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
-    if not item:
+async def get_menu_item(item_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    snapshot = await menu_store.current(db)
+    cached = snapshot.item_response(item_id)
+    if not cached:
         raise HTTPException(status_code=404, detail="Menu item not found")
-    return item
+    return cached_response(request, *cached)
 
 @router.post("/items", response_model=MenuItemResponse)
 async def create_menu_item(
     item: MenuItemCreate,
-    db: Session = Depends(get_db),
-    _: User = Depends(is_admin)
+    db: AsyncSession = Depends(get_db),
+    _: Principal = Depends(is_admin)
 ):
     db_item = MenuItem(**item.dict())
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await commit_menu_write(db)
+    await db.refresh(db_item)
+    await menu_store.load(db)
     return db_item
 
 @router.put("/items/{item_id}", response_model=MenuItemResponse)
 async def update_menu_item(
     item_id: int,
     item: MenuItemUpdate,
-    db: Session = Depends(get_db),
-    _: User = Depends(is_admin)
+    db: AsyncSession = Depends(get_db),
+    _: Principal = Depends(is_admin)
 ):
-    db_item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
+    db_item = await db.get(MenuItem, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Menu item not found")
     
     for key, value in item.dict().items():
         setattr(db_item, key, value)
     
-    db.commit()
-    db.refresh(db_item)
+    await commit_menu_write(db)
+    await db.refresh(db_item)
+    await menu_store.load(db)
     return db_item
 
 @router.delete("/items/{item_id}")
 async def delete_menu_item(
     item_id: int,
-    db: Session = Depends(get_db),
-    _: User = Depends(is_admin)
+    db: AsyncSession = Depends(get_db),
+    _: Principal = Depends(is_admin)
 ):
-    db_item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
+    db_item = await db.get(MenuItem, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Menu item not found")
     
-    db.delete(db_item)
-    db.commit()
+    await db.delete(db_item)
+    await commit_menu_write(db)
+    await menu_store.load(db)
     return {"message": "Menu item deleted successfully"}
 
 # Menu Categories endpoints
 @router.get("/categories", response_model=List[MenuCategoryResponse])
-async def get_menu_categories(db: Session = Depends(get_db)):
-    return db.query(MenuCategory).order_by(MenuCategory.display_order).all()
+async def get_menu_categories(request: Request, db: AsyncSession = Depends(get_db)):
+    snapshot = await menu_store.current(db)
+    body, etag = snapshot.categories_response()
+    return cached_response(request, body, etag)
 
 @router.get("/categories/{category_id}", response_model=MenuCategoryResponse)
-async def get_menu_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(MenuCategory).filter(MenuCategory.id == category_id).first()
-    if not category:
+async def get_menu_category(category_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    snapshot = await menu_store.current(db)
+    cached = snapshot.category_response(category_id)
+    if not cached:
         raise HTTPException(status_code=404, detail="Category not found")
-    return category
+    return cached_response(request, *cached)
 
 @router.post("/categories", response_model=MenuCategoryResponse)
 async def create_menu_category(
     category: MenuCategoryCreate,
-    db: Session = Depends(get_db),
-    _: User = Depends(is_admin)
+    db: AsyncSession = Depends(get_db),
+    _: Principal = Depends(is_admin)
 ):
     db_category = MenuCategory(**category.dict())
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await commit_menu_write(db)
+    await db.refresh(db_category)
+    await menu_store.load(db)
     return db_category
 
 @router.put("/categories/{category_id}", response_model=MenuCategoryResponse)
 async def update_menu_category(
     category_id: int,
     category: MenuCategoryUpdate,
-    db: Session = Depends(get_db),
-    _: User = Depends(is_admin)
+    db: AsyncSession = Depends(get_db),
+    _: Principal = Depends(is_admin)
 ):
-    db_category = db.query(MenuCategory).filter(MenuCategory.id == category_id).first()
+    db_category = await db.get(MenuCategory, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     
     for key, value in category.dict().items():
         setattr(db_category, key, value)
     
-    db.commit()
-    db.refresh(db_category)
+    await commit_menu_write(db)
+    await db.refresh(db_category)
+    await menu_store.load(db)
     return db_category
 
 @router.delete("/categories/{category_id}")
 async def delete_menu_category(
     category_id: int,
-    db: Session = Depends(get_db),
-    _: User = Depends(is_admin)
+    db: AsyncSession = Depends(get_db),
+    _: Principal = Depends(is_admin)
 ):
-    db_category = db.query(MenuCategory).filter(MenuCategory.id == category_id).first()
+    db_category = await db.get(MenuCategory, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     
     # Check if there are any menu items in this category
-    items_count = db.query(MenuItem).filter(MenuItem.category == db_category.name).count()
+    items_count = await db.scalar(
+        select(func.count()).select_from(MenuItem).where(MenuItem.category == db_category.name)
+    )
     if items_count > 0:
         raise HTTPException(
             status_code=400,
             detail="Cannot delete category with existing menu items"
         )
     
-    db.delete(db_category)
-    db.commit()
+    await db.delete(db_category)
+    await commit_menu_write(db)
+    await menu_store.load(db)
     return {"message": "Category deleted successfully"} 
\ No newline at end of file
@@ -1,16 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import base64
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
 from typing import List, Optional
 from database import get_db
 from models.order import Order, OrderItem, OrderStatus, PaymentStatus, PaymentMethod
 from models.menu import MenuItem
 from models.user import User, UserRole
-from utils.auth import get_current_user
+from utils.auth import get_current_principal, Principal
+from utils.order_feed import order_feed, ORDER_FEED_MAX_SUBSCRIBERS
+from utils.sales_rollup import SaleLine, order_lines, record_order, record_payment
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 
 router = APIRouter()
 
+# Order listings are paged; clients follow the X-Next-Cursor header
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "50"))
+ORDERS_MAX_PAGE_SIZE = int(os.getenv("ORDERS_MAX_PAGE_SIZE", "200"))
+
 # Pydantic models for request/response
 class OrderItemCreate(BaseModel):
     menu_item_id: int
@@ -51,7 +63,7 @@ class OrderResponse(BaseModel):
     items: List[OrderItemResponse]
 
 # Helper function to check if user is staff (admin or worker)
-async def is_staff(user: User = Depends(get_current_user)):
+async def is_staff(user: Principal = Depends(get_current_principal)):
     if user.role not in [UserRole.ADMIN, UserRole.WORKER]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -59,34 +71,135 @@ async def is_staff(user: User = Depends(get_current_user)):
         )
     return user
 
+async def load_order(db: AsyncSession, order_id: int) -> Optional[Order]:
+    """An order with its items loaded, as OrderResponse needs them (async sessions cannot lazy-load)"""
+    return await db.scalar(
+        select(Order)
+        .options(selectinload(Order.items))
+        .where(Order.id == order_id)
+        .execution_options(populate_existing=True)
+    )
+
+def publish_order(kind: str, order: Order, previous_status: Optional[OrderStatus] = None):
+    """Push a committed order change to the live feed"""
+    order_feed.publish(
+        kind,
+        OrderResponse.model_validate(order).model_dump(mode="json"),
+        previous_status.value if previous_status else None,
+    )
+
+def encode_cursor(order: Order) -> str:
+    return base64.urlsafe_b64encode(f"{order.created_at.isoformat()}|{order.id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in OrderResponse.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def project_order(order: Order, fields: List[str]) -> dict:
+    data = {}
+    for field in fields:
+        if field == "items":
+            data[field] = [OrderItemResponse.model_validate(item).model_dump(mode="json") for item in order.items]
+        else:
+            data[field] = jsonable_encoder(getattr(order, field))
+    return data
+
 # Order endpoints
 @router.get("/", response_model=List[OrderResponse])
 async def get_orders(
+    response: Response,
     status: Optional[OrderStatus] = None,
     payment_status: Optional[PaymentStatus] = None,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = ORDERS_PAGE_SIZE,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(Order)
+    """
+    Newest orders first, one keyset page on (created_at, id) at a time.
+    Pass the X-Next-Cursor header back as `after` for the next page, and
+    `fields=id,status,...` to return only those fields.
+    """
+    selected = parse_fields(fields)
+    limit = max(1, min(limit, ORDERS_MAX_PAGE_SIZE))
+    query = select(Order)
     
     # Regular users can only see their own orders
     if user.role == UserRole.CUSTOMER:
-        query = query.filter(Order.user_id == user.id)
+        query = query.where(Order.user_id == user.id)
     
     if status:
-        query = query.filter(Order.status == status)
+        query = query.where(Order.status == status)
     if payment_status:
-        query = query.filter(Order.payment_status == payment_status)
-    
-    return query.order_by(Order.created_at.desc()).all()
+        query = query.where(Order.payment_status == payment_status)
+    if after:
+        created_at, order_id = decode_cursor(after)
+        query = query.where(or_(
+            Order.created_at < created_at,
+            and_(Order.created_at == created_at, Order.id < order_id)
+        ))
+
+    # Items for the whole page come from one extra SELECT ... IN query
+    if selected is None or "items" in selected:
+        query = query.options(selectinload(Order.items))
+    if selected is not None:
+        columns = {"id", "created_at"} | (set(selected) - {"items"})
+        query = query.options(load_only(*(getattr(Order, column) for column in columns)))
+
+    orders = (await db.scalars(query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit))).all()
+    headers = {"X-Next-Cursor": encode_cursor(orders[-1])} if len(orders) == limit else {}
+
+    if selected is not None:
+        return JSONResponse(content=[project_order(order, selected) for order in orders], headers=headers)
+    response.headers.update(headers)
+    return orders
+
+@router.get("/feed")
+async def order_feed_stream(
+    status: Optional[List[OrderStatus]] = Query(None),
+    is_takeout: Optional[bool] = None,
+    last_event_id: Optional[str] = Header(None),
+    _: Principal = Depends(is_staff),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Server-sent events for every order change, instead of polling the
+    listing. Filter with `status` (repeatable) and `is_takeout`; an order
+    leaving a watched status is still sent. Reconnects with Last-Event-ID
+    replay what was missed, or get a `reset` event when that is no longer
+    buffered and should reload the listing.
+    """
+    if len(order_feed.subscribers) >= ORDER_FEED_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many feed subscribers")
+    # Authorization may have used a connection; don't hold it for the life of the stream
+    await db.close()
+    statuses = frozenset(value.value for value in status) if status else None
+    return StreamingResponse(
+        order_feed.stream(statuses, is_takeout, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await load_order(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -99,30 +212,39 @@ async def get_order(
 @router.post("/", response_model=OrderResponse)
 async def create_order(
     order: OrderCreate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
+    # Resolve every referenced menu item in one IN query instead of one query per line
+    requested_ids = {item.menu_item_id for item in order.items}
+    menu_items = {
+        row.id: row
+        for row in await db.execute(
+            select(MenuItem.id, MenuItem.name, MenuItem.price, MenuItem.is_available, MenuItem.category)
+            .where(MenuItem.id.in_(requested_ids))
+        )
+    }
+
     # Calculate total amount and validate menu items
     total_amount = 0
     order_items = []
     
     for item in order.items:
-        menu_item = db.query(MenuItem).filter(MenuItem.id == item.menu_item_id).first()
+        menu_item = menu_items.get(item.menu_item_id)
         if not menu_item:
             raise HTTPException(status_code=404, detail=f"Menu item {item.menu_item_id} not found")
         if not menu_item.is_available:
             raise HTTPException(status_code=400, detail=f"Menu item {menu_item.name} is not available")
         
         item_total = menu_item.price * item.quantity
-        order_items.append(
-            OrderItem(
-                menu_item_id=item.menu_item_id,
-                quantity=item.quantity,
-                unit_price=menu_item.price,
-                total_price=item_total,
-                special_instructions=item.special_instructions
-            )
-        )
+        order_items.append({
+            "menu_item_id": item.menu_item_id,
+            "quantity": item.quantity,
+            "unit_price": menu_item.price,
+            "total_price": item_total,
+            "special_instructions": item.special_instructions,
+            "category": menu_item.category.value if menu_item.category else None,
+        })
         total_amount += item_total
 
     # Create order
@@ -132,23 +254,33 @@ async def create_order(
         special_instructions=order.special_instructions,
         is_takeout=order.is_takeout,
         table_number=order.table_number,
-        payment_method=order.payment_method,
-        items=order_items
+        payment_method=order.payment_method
     )
     
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+    await db.flush()
+    # All order items in one executemany INSERT rather than one per object. An
+    # empty parameter list would run the INSERT once with every column NULL.
+    if order_items:
+        await db.execute(insert(OrderItem), [{**row, "order_id": db_order.id} for row in order_items])
+    await record_order(db, db_order, [
+        SaleLine(row["menu_item_id"], row["category"], row["quantity"], row["total_price"])
+        for row in order_items
+    ])
+    await db.commit()
+    db_order = await load_order(db, db_order.id)
+    publish_order("created", db_order)
     return db_order
 
 @router.put("/{order_id}", response_model=OrderResponse)
 async def update_order(
     order_id: int,
     order_update: OrderUpdate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_order = db.query(Order).filter(Order.id == order_id).first()
+    # Row lock: the sales rollup delta depends on the payment status read here
+    db_order = await db.get(Order, order_id, with_for_update=True)
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -162,20 +294,25 @@ async def update_order(
         raise HTTPException(status_code=403, detail="Not authorized to update this order")
     
     # Update order
+    previous_status = db_order.status
+    previous_payment_status = db_order.payment_status
     for key, value in order_update.dict(exclude_unset=True).items():
         setattr(db_order, key, value)
     
-    db.commit()
-    db.refresh(db_order)
+    await record_payment(db, db_order, previous_payment_status)
+    await db.commit()
+    db_order = await load_order(db, order_id)
+    publish_order("updated", db_order, previous_status)
     return db_order
 
 @router.delete("/{order_id}")
 async def delete_order(
     order_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_order = db.query(Order).filter(Order.id == order_id).first()
+    # Row lock: the sales rollup delta depends on the payment status read here
+    db_order = await db.get(Order, order_id, with_for_update=True)
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -183,8 +320,11 @@ async def delete_order(
     if user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin can delete orders")
     
-    db.delete(db_order)
-    db.commit()
+    deleted = {"id": db_order.id, "status": db_order.status.value, "is_takeout": db_order.is_takeout}
+    await record_order(db, db_order, await order_lines(db, order_id), sign=-1)
+    await db.delete(db_order)
+    await db.commit()
+    order_feed.publish("deleted", deleted, deleted["status"])
     return {"message": "Order deleted successfully"}
 
 # Staff-only endpoints
@@ -192,30 +332,36 @@ async def delete_order(
 async def update_order_status(
     order_id: int,
     status: OrderStatus,
-    _: User = Depends(is_staff),
-    db: Session = Depends(get_db)
+    _: Principal = Depends(is_staff),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_order = db.query(Order).filter(Order.id == order_id).first()
+    db_order = await db.get(Order, order_id)
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    previous_status = db_order.status
     db_order.status = status
-    db.commit()
-    db.refresh(db_order)
+    await db.commit()
+    db_order = await load_order(db, order_id)
+    publish_order("status", db_order, previous_status)
     return db_order
 
 @router.put("/{order_id}/payment", response_model=OrderResponse)
 async def update_payment_status(
     order_id: int,
     payment_status: PaymentStatus,
-    _: User = Depends(is_staff),
-    db: Session = Depends(get_db)
+    _: Principal = Depends(is_staff),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_order = db.query(Order).filter(Order.id == order_id).first()
+    # Row lock: the sales rollup delta depends on the payment status read here
+    db_order = await db.get(Order, order_id, with_for_update=True)
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    previous_payment_status = db_order.payment_status
     db_order.payment_status = payment_status
-    db.commit()
-    db.refresh(db_order)
+    await record_payment(db, db_order, previous_payment_status)
+    await db.commit()
+    db_order = await load_order(db, order_id)
+    publish_order("payment", db_order)
     return db_order 
\ No newline at end of file
@@ -0,0 +1,47 @@
+import enum
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+from models.menu import MenuItem
+from routers.menu import is_admin
+from utils.auth import Principal
+from utils.sales_rollup import sales_report
+
+router = APIRouter()
+
+class SalesGrouping(str, enum.Enum):
+    ITEM = "item"
+    CATEGORY = "category"
+    PAYMENT_METHOD = "payment_method"
+    HOUR = "hour"
+
+def _utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # Orders store naive UTC timestamps
+    if moment is not None and moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+@router.get("/sales")
+async def get_sales_report(
+    group_by: SalesGrouping = SalesGrouping.ITEM,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    _: Principal = Depends(is_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Orders, quantities and revenue (placed and paid) from the sales rollups,
+    grouped by menu item, category, payment method or hour, for
+    `start <= hour < end` (UTC)
+    """
+    report = await sales_report(db, group_by.value, _utc(start), _utc(end))
+    if group_by == SalesGrouping.ITEM and report["groups"]:
+        names = dict((await db.execute(
+            select(MenuItem.id, MenuItem.name).where(MenuItem.id.in_([int(group["key"]) for group in report["groups"]]))
+        )).all())
+        for group in report["groups"]:
+            group["name"] = names.get(int(group["key"]))
+    return report
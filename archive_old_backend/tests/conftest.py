@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Modules import each other as top-level names (database, models, utils), as when run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep database.py off any configured server; tests that need tables create their own engine
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "import.db")
+# Token signing refuses to start without a private key
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import pytest
+import utils.order_feed as order_feed_module
+from utils.order_feed import OrderFeed
+
+def order(order_id, status="pending", is_takeout=False):
+    return {"id": order_id, "status": status, "is_takeout": is_takeout}
+
+def parse(frame: bytes) -> dict:
+    fields = {}
+    for line in frame.decode().strip().split("\n"):
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    return fields
+
+def ids(frames) -> list:
+    return [json.loads(parse(frame)["data"])["order"]["id"] for frame in frames]
+
+async def take(stream, count: int) -> list:
+    return [await asyncio.wait_for(stream.__anext__(), 1) for _ in range(count)]
+
+async def subscribe(feed, **kwargs):
+    stream = feed.stream(**kwargs)
+    assert await stream.__anext__() == b"retry: 3000\n\n"
+    return stream
+
+def run(coro):
+    return asyncio.run(coro)
+
+@pytest.fixture
+def small_queue(monkeypatch):
+    monkeypatch.setattr(order_feed_module, "ORDER_FEED_QUEUE_SIZE", 2)
+
+def test_publish_reaches_subscriber_with_event_id():
+    async def scenario():
+        feed = OrderFeed()
+        stream = await subscribe(feed)
+        feed.publish("created", order(1))
+        frame = parse((await take(stream, 1))[0])
+        assert frame["id"] == f"{feed.epoch}-1"
+        assert frame["event"] == "created"
+        assert json.loads(frame["data"]) == {"type": "created", "previous_status": None, "order": order(1)}
+        await stream.aclose()
+        assert not feed.subscribers
+    run(scenario())
+
+def test_status_filter_includes_orders_leaving_the_status():
+    async def scenario():
+        feed = OrderFeed()
+        stream = await subscribe(feed, statuses=frozenset({"preparing"}))
+        feed.publish("created", order(1))
+        feed.publish("status", order(2, "preparing"), "confirmed")
+        feed.publish("status", order(3, "ready"), "preparing")
+        feed.publish("status", order(4, "delivered"), "ready")
+        assert ids(await take(stream, 2)) == [2, 3]
+        await stream.aclose()
+    run(scenario())
+
+def test_takeout_filter():
+    async def scenario():
+        feed = OrderFeed()
+        stream = await subscribe(feed, is_takeout=True)
+        feed.publish("created", order(1, is_takeout=False))
+        feed.publish("created", order(2, is_takeout=True))
+        assert ids(await take(stream, 1)) == [2]
+        await stream.aclose()
+    run(scenario())
+
+def test_slow_subscriber_catches_up_from_replay_in_order(small_queue):
+    async def scenario():
+        feed = OrderFeed(replay_size=10)
+        stream = await subscribe(feed)
+        for order_id in range(1, 6):
+            feed.publish("created", order(order_id))
+        assert feed.lagged == 1
+        frames = await take(stream, 5)
+        assert ids(frames) == [1, 2, 3, 4, 5]
+        # Back to live delivery, with no duplicates
+        feed.publish("created", order(6))
+        assert ids(await take(stream, 1)) == [6]
+        assert feed.resets == 0
+        await stream.aclose()
+    run(scenario())
+
+def test_publish_never_blocks_on_a_full_queue(small_queue):
+    feed = OrderFeed()
+    async def scenario():
+        stream = await subscribe(feed)
+        for order_id in range(1, 101):
+            feed.publish("created", order(order_id))
+        (subscriber,) = feed.subscribers
+        assert subscriber.queue.qsize() == 2
+        assert subscriber.lagging
+        await stream.aclose()
+    run(scenario())
+
+def test_subscriber_past_the_replay_buffer_gets_a_reset(small_queue):
+    async def scenario():
+        feed = OrderFeed(replay_size=3)
+        stream = await subscribe(feed)
+        for order_id in range(1, 8):
+            feed.publish("created", order(order_id))
+        frames = await take(stream, 3)
+        assert ids(frames[:2]) == [1, 2]
+        reset = parse(frames[2])
+        assert reset["event"] == "reset"
+        assert reset["id"] == f"{feed.epoch}-7"
+        feed.publish("created", order(8))
+        assert ids(await take(stream, 1)) == [8]
+        await stream.aclose()
+    run(scenario())
+
+def test_resume_replays_only_missed_matching_events():
+    async def scenario():
+        feed = OrderFeed()
+        for order_id in range(1, 5):
+            feed.publish("created", order(order_id, is_takeout=order_id % 2 == 0))
+        stream = await subscribe(feed, is_takeout=True, last_event_id=f"{feed.epoch}-1")
+        assert ids(await take(stream, 2)) == [2, 4]
+        feed.publish("created", order(5, is_takeout=True))
+        assert ids(await take(stream, 1)) == [5]
+        await stream.aclose()
+    run(scenario())
+
+def test_resume_from_latest_event_replays_nothing():
+    async def scenario():
+        feed = OrderFeed()
+        feed.publish("created", order(1))
+        stream = await subscribe(feed, last_event_id=f"{feed.epoch}-1")
+        feed.publish("created", order(2))
+        assert ids(await take(stream, 1)) == [2]
+        await stream.aclose()
+    run(scenario())
+
+@pytest.mark.parametrize("last_event_id", ["other-1", "garbage", "{epoch}-99", "{epoch}-x", "{epoch}-0"])
+def test_unusable_event_ids_get_a_reset(last_event_id):
+    async def scenario():
+        feed = OrderFeed(replay_size=2)
+        for order_id in range(1, 4):
+            feed.publish("created", order(order_id))
+        stream = await subscribe(feed, last_event_id=last_event_id.format(epoch=feed.epoch))
+        assert parse((await take(stream, 1))[0])["event"] == "reset"
+        await stream.aclose()
+    run(scenario())
+
+def test_idle_stream_sends_keepalives(monkeypatch):
+    monkeypatch.setattr(order_feed_module, "ORDER_FEED_KEEPALIVE", 0.01)
+    async def scenario():
+        feed = OrderFeed()
+        stream = await subscribe(feed)
+        assert await take(stream, 1) == [b": keepalive\n\n"]
+        await stream.aclose()
+    run(scenario())
+
+def test_stats_count_deliveries():
+    async def scenario():
+        feed = OrderFeed()
+        stream = await subscribe(feed)
+        feed.publish("created", order(1))
+        await take(stream, 1)
+        stats = feed.stats()
+        assert stats["subscribers"] == 1
+        assert stats["published"] == 1
+        assert stats["delivered"] == 1
+        await stream.aclose()
+    run(scenario())
@@ -0,0 +1,228 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from database import Base
+import models.user  # noqa: F401 -- Order.user refers to it
+from models.menu import Category, MenuItem
+from models.order import Order, OrderItem, PaymentMethod, PaymentStatus
+from models.report import SalesRollup
+from utils.sales_rollup import (
+    SaleLine, contributions, hour_bucket, order_lines, rebuild, record_order, record_payment, sales_report,
+)
+
+PLACED = datetime(2024, 5, 1, 12, 34, 56)
+HOUR = datetime(2024, 5, 1, 12)
+
+def fake_order(total=10.0, payment_method=PaymentMethod.CASH, created_at=PLACED):
+    return SimpleNamespace(total_amount=total, payment_method=payment_method, created_at=created_at)
+
+LINES = [
+    SaleLine(1, Category.MAIN_COURSE, 2, 6.0),
+    SaleLine(2, "Dessert", 1, 4.0),
+]
+
+# Deltas
+
+def test_hour_bucket_truncates_to_the_hour():
+    assert hour_bucket(PLACED) == HOUR
+
+def test_created_order_contributes_to_every_dimension():
+    deltas = contributions(fake_order(), LINES, 1, 0)
+    assert deltas == {
+        (HOUR, "item", "1"): (1, 2, 6.0, 0, 0.0),
+        (HOUR, "item", "2"): (1, 1, 4.0, 0, 0.0),
+        (HOUR, "category", "Main Course"): (1, 2, 6.0, 0, 0.0),
+        (HOUR, "category", "Dessert"): (1, 1, 4.0, 0, 0.0),
+        (HOUR, "payment_method", "cash"): (1, 3, 10.0, 0, 0.0),
+    }
+
+def test_lines_of_one_item_count_the_order_once():
+    lines = [SaleLine(1, "Side", 1, 2.0), SaleLine(1, "Side", 3, 6.0)]
+    deltas = contributions(fake_order(total=8.0), lines, 1, 0)
+    assert deltas[(HOUR, "item", "1")] == (1, 4, 8.0, 0, 0.0)
+    assert deltas[(HOUR, "category", "Side")] == (1, 4, 8.0, 0, 0.0)
+
+def test_payment_delta_only_moves_paid_measures():
+    deltas = contributions(fake_order(), LINES, 0, 1)
+    assert deltas[(HOUR, "payment_method", "cash")] == (0, 0, 0.0, 1, 10.0)
+    refund = contributions(fake_order(), LINES, 0, -1)
+    assert refund[(HOUR, "item", "1")] == (0, 0, 0.0, -1, -6.0)
+
+def test_deleting_a_paid_order_reverses_its_creation_and_payment():
+    created = contributions(fake_order(), LINES, 1, 0)
+    paid = contributions(fake_order(), LINES, 0, 1)
+    deleted = contributions(fake_order(), LINES, -1, -1)
+    for key in created:
+        assert tuple(a + b + c for a, b, c in zip(created[key], paid[key], deleted[key])) == (0, 0, 0.0, 0, 0.0)
+
+def test_missing_payment_method_and_category_get_placeholder_keys():
+    deltas = contributions(fake_order(payment_method=None, total=None), [SaleLine(5, None, 1, 0.0)], 1, 0)
+    assert (HOUR, "payment_method", "unspecified") in deltas
+    assert (HOUR, "category", "unknown") in deltas
+
+# Against a database
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'rollups.db'}")
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as db:
+            db.add_all([
+                MenuItem(id=1, name="Tacos", price=3.0, category=Category.MAIN_COURSE),
+                MenuItem(id=2, name="Flan", price=4.0, category=Category.DESSERT),
+            ])
+            await db.commit()
+
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+async def place_order(db, items, payment_method=PaymentMethod.CASH, created_at=PLACED, store_category=True):
+    prices = {1: 3.0, 2: 4.0}
+    categories = dict((await db.execute(select(MenuItem.id, MenuItem.category))).all())
+    order = Order(
+        user_id=1,
+        total_amount=sum(prices[item] * quantity for item, quantity in items),
+        payment_method=payment_method,
+        created_at=created_at,
+    )
+    db.add(order)
+    await db.flush()
+    rows = [
+        {
+            "order_id": order.id, "menu_item_id": item, "quantity": quantity, "unit_price": prices[item],
+            "total_price": prices[item] * quantity, "category": categories[item].value if store_category else None,
+        }
+        for item, quantity in items
+    ]
+    await db.execute(insert(OrderItem), rows)
+    await record_order(db, order, await order_lines(db, order.id))
+    await db.commit()
+    return order
+
+async def set_payment(db, order_id, status):
+    order = await db.get(Order, order_id, with_for_update=True)
+    previous = order.payment_status
+    order.payment_status = status
+    await record_payment(db, order, previous)
+    await db.commit()
+
+async def delete_order(db, order_id):
+    order = await db.get(Order, order_id, with_for_update=True)
+    await record_order(db, order, await order_lines(db, order_id), sign=-1)
+    await db.delete(order)
+    await db.commit()
+
+async def move_item(db, item_id, category):
+    item = await db.get(MenuItem, item_id)
+    item.category = category
+    await db.commit()
+
+async def rollup_rows(db):
+    rows = await db.scalars(select(SalesRollup).where(SalesRollup.orders != 0))
+    return sorted(
+        (row.hour, row.dimension, row.key, row.orders, row.quantity, round(row.revenue, 6), row.paid_orders, round(row.paid_revenue, 6))
+        for row in rows
+    )
+
+def test_incremental_rollups_match_a_rebuild(session_factory):
+    async def scenario():
+        async with session_factory() as db:
+            first = await place_order(db, [(1, 2), (2, 1)])
+            second = await place_order(db, [(1, 1)], payment_method=PaymentMethod.ONLINE)
+            third = await place_order(db, [(2, 3)], created_at=datetime(2024, 5, 1, 13, 5))
+            await set_payment(db, first.id, PaymentStatus.PAID)
+            await set_payment(db, first.id, PaymentStatus.PAID)  # no change, no delta
+            await set_payment(db, second.id, PaymentStatus.PAID)
+            await set_payment(db, second.id, PaymentStatus.REFUNDED)
+            await set_payment(db, third.id, PaymentStatus.PAID)
+            await delete_order(db, third.id)
+            incremental = await rollup_rows(db)
+            assert await rebuild(db, batch_size=1) == 2
+            assert await rollup_rows(db) == incremental
+
+            report = await sales_report(db, "payment_method")
+            assert report["totals"] == {"orders": 2, "quantity": 4, "revenue": 13.0, "paid_orders": 1, "paid_revenue": 10.0}
+            assert [group["key"] for group in report["groups"]] == ["cash", "online"]
+    asyncio.run(scenario())
+
+def test_report_groups_and_ranges(session_factory):
+    async def scenario():
+        async with session_factory() as db:
+            await place_order(db, [(1, 2), (2, 1)])
+            await place_order(db, [(2, 1)], created_at=datetime(2024, 5, 1, 14, 10))
+
+            by_item = await sales_report(db, "item")
+            assert [(group["key"], group["orders"], group["quantity"]) for group in by_item["groups"]] == [("1", 1, 2), ("2", 2, 2)]
+            assert by_item["totals"]["orders"] == 2
+            assert by_item["totals"]["revenue"] == 14.0
+
+            by_hour = await sales_report(db, "hour")
+            assert [group["key"] for group in by_hour["groups"]] == ["2024-05-01T12:00:00", "2024-05-01T14:00:00"]
+
+            # start is rounded down to its hour, end is exclusive
+            ranged = await sales_report(db, "category", start=datetime(2024, 5, 1, 12, 30), end=datetime(2024, 5, 1, 14))
+            assert {group["key"]: group["orders"] for group in ranged["groups"]} == {"Dessert": 1, "Main Course": 1}
+            assert ranged["totals"]["orders"] == 1
+    asyncio.run(scenario())
+
+def test_deleted_keys_drop_out_of_reports(session_factory):
+    async def scenario():
+        async with session_factory() as db:
+            order = await place_order(db, [(1, 1)], payment_method=PaymentMethod.DEBIT_CARD)
+            await place_order(db, [(2, 1)])
+            await delete_order(db, order.id)
+            report = await sales_report(db, "payment_method")
+            assert [group["key"] for group in report["groups"]] == ["cash"]
+            items = await sales_report(db, "item")
+            assert [group["key"] for group in items["groups"]] == ["2"]
+    asyncio.run(scenario())
+
+def assert_groups_add_up(report):
+    # Orders with items in several categories count once under each, so only these are additive
+    assert sum(group["quantity"] for group in report["groups"]) == report["totals"]["quantity"]
+    for measure in ("revenue", "paid_revenue"):
+        assert sum(group[measure] for group in report["groups"]) == pytest.approx(report["totals"][measure])
+
+def test_sales_stay_under_the_category_they_were_placed_in(session_factory):
+    async def scenario():
+        async with session_factory() as db:
+            first = await place_order(db, [(1, 2)])
+            await move_item(db, 1, Category.SIDE)
+            await set_payment(db, first.id, PaymentStatus.PAID)
+            second = await place_order(db, [(1, 1)])
+            await set_payment(db, second.id, PaymentStatus.PAID)
+            await delete_order(db, second.id)
+            await move_item(db, 1, Category.APPETIZER)
+            await place_order(db, [(1, 1), (2, 1)])
+
+            report = await sales_report(db, "category")
+            assert {group["key"]: (group["orders"], group["paid_orders"]) for group in report["groups"]} == {
+                "Main Course": (1, 1), "Appetizer": (1, 0), "Dessert": (1, 0),
+            }
+            assert_groups_add_up(report)
+            incremental = await rollup_rows(db)
+            await rebuild(db)
+            assert await rollup_rows(db) == incremental
+    asyncio.run(scenario())
+
+def test_rebuild_stores_the_category_of_older_lines(session_factory):
+    async def scenario():
+        async with session_factory() as db:
+            order = await place_order(db, [(1, 1), (2, 1)], store_category=False)
+            await rebuild(db)
+            stored = dict((await db.execute(select(OrderItem.menu_item_id, OrderItem.category))).all())
+            assert stored == {1: "Main Course", 2: "Dessert"}
+
+            await move_item(db, 1, Category.SIDE)
+            await set_payment(db, order.id, PaymentStatus.PAID)
+            report = await sales_report(db, "category")
+            assert {group["key"]: group["paid_orders"] for group in report["groups"]} == {"Main Course": 1, "Dessert": 1}
+            assert_groups_add_up(report)
+    asyncio.run(scenario())
@@ -0,0 +1,180 @@
+import heapq
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Distinct statement fingerprints tracked before new ones are folded into "<other>"
+DB_METRICS_MAX_FINGERPRINTS = int(os.getenv("DB_METRICS_MAX_FINGERPRINTS", "500"))
+# How many of the slowest individual statements to keep
+DB_METRICS_SLOWEST = int(os.getenv("DB_METRICS_SLOWEST", "20"))
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*,?)+\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+|:\w+")
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(statement: str) -> str:
+    """Normalize SQL so statements differing only in values or IN-list length group together"""
+    sql = _STRING.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+class Timing:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 2),
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+class DBMetrics:
+    """
+    Pool checkout waits, per-fingerprint statement timings, the slowest
+    statements and statements per route, fed by SQLAlchemy events
+    """
+
+    def __init__(self, max_fingerprints: int, slowest: int):
+        self.max_fingerprints = max_fingerprints
+        self.slowest_count = slowest
+        self.checkout_wait = Timing()
+        self.checkout_timeouts = 0
+        self.peak_checked_out = 0
+        self.statements = {}
+        self.slowest = []
+        self.routes = {}
+        self.engine = None
+
+    def record_wait(self, elapsed: float):
+        self.checkout_wait.add(elapsed)
+
+    def record_statement(self, statement: str, elapsed: float):
+        key = fingerprint(statement)
+        timing = self.statements.get(key)
+        if timing is None:
+            if len(self.statements) >= self.max_fingerprints:
+                key = "<other>"
+            timing = self.statements.setdefault(key, Timing())
+        timing.add(elapsed)
+
+        entry = (elapsed, time.time(), key)
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, entry)
+        elif self.slowest and elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+        counter = _request_statements.get()
+        if counter is not None:
+            counter[0] += 1
+
+    def record_route(self, route: str, statements: int):
+        timing = self.routes.get(route)
+        if timing is None:
+            if len(self.routes) >= self.max_fingerprints:
+                return
+            timing = self.routes[route] = Timing()
+        timing.add(statements)
+
+    def stats(self, top: int = 20) -> dict:
+        pool = {}
+        current = self.engine.pool if self.engine is not None else None
+        if isinstance(current, AsyncAdaptedQueuePool):
+            pool = {
+                "size": current.size(),
+                "checked_out": current.checkedout(),
+                "checked_in": current.checkedin(),
+                "overflow": max(0, current.overflow()),
+            }
+        busiest = sorted(self.statements.items(), key=lambda item: item[1].total, reverse=True)[:top]
+        return {
+            "pool": {
+                **pool,
+                "peak_checked_out": self.peak_checked_out,
+                "checkout_wait": self.checkout_wait.as_dict(),
+                "checkout_timeouts": self.checkout_timeouts,
+            },
+            "statements": {key: timing.as_dict() for key, timing in busiest},
+            "slowest": [
+                {"ms": round(elapsed * 1000, 2), "at": round(at, 3), "sql": key}
+                for elapsed, at, key in sorted(self.slowest, reverse=True)
+            ],
+            # Statement counts per request; a rising avg/max flags an N+1
+            "statements_per_request": {
+                route: {"requests": timing.count, "avg": round(timing.total / timing.count, 2), "max": int(timing.max)}
+                for route, timing in self.routes.items()
+            },
+        }
+
+db_metrics = DBMetrics(DB_METRICS_MAX_FINGERPRINTS, DB_METRICS_SLOWEST)
+
+# Statement counter for the current request, set by the metrics middleware
+_request_statements: ContextVar[Optional[list]] = ContextVar("request_statements", default=None)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that times each checkout: waiting for a free connection plus
+    opening a new one when the pool is allowed to grow
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            db_metrics.checkout_timeouts += 1
+            raise
+        finally:
+            db_metrics.record_wait(time.perf_counter() - started)
+
+def instrument(engine):
+    """Attach the statement timing and pool events to an (async) engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    db_metrics.engine = sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        db_metrics.record_statement(statement, time.perf_counter() - context._query_start)
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        pool = sync_engine.pool
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            db_metrics.peak_checked_out = max(db_metrics.peak_checked_out, pool.checkedout())
+
+async def count_statements(request, call_next):
+    """HTTP middleware recording how many statements each route ran"""
+    counter = [0]
+    token = _request_statements.set(counter)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_statements.reset(token)
+    # Keyed by handler: route paths inside included routers omit their prefix
+    endpoint = getattr(request.scope.get("route"), "endpoint", None)
+    if counter[0] and endpoint is not None:
+        db_metrics.record_route(f"{endpoint.__module__}.{endpoint.__name__}", counter[0])
+    return response
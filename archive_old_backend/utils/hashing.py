@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# bcrypt releases the GIL, so a small thread pool runs hashes in parallel
+# without blocking the event loop
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait for a worker before new ones are rejected with 503
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# deprecated="auto" plus the configured rounds makes verify_and_update
+# return a new hash whenever a stored hash uses other cost parameters
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class HashPool:
+    """
+    Bounded worker pool for password hashing with queue-wait and
+    hash-time metrics
+    """
+
+    def __init__(self, size: int, queue_limit: int):
+        self.size = size
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    async def run(self, fn, *args):
+        if self.pending >= self.size + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, wait, elapsed = await loop.run_in_executor(self._executor, self._timed, submitted, fn, args)
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.queue_wait_total += wait
+        self.queue_wait_max = max(self.queue_wait_max, wait)
+        self.hash_time_total += elapsed
+        self.hash_time_max = max(self.hash_time_max, elapsed)
+        return result
+
+    @staticmethod
+    def _timed(submitted: float, fn, args):
+        started = time.perf_counter()
+        result = fn(*args)
+        return result, started - submitted, time.perf_counter() - started
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "pool_size": self.size,
+            "queue_limit": self.queue_limit,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "queue_wait_avg_ms": round(self.queue_wait_total / completed * 1000, 2),
+            "queue_wait_max_ms": round(self.queue_wait_max * 1000, 2),
+            "hash_time_avg_ms": round(self.hash_time_total / completed * 1000, 2),
+            "hash_time_max_ms": round(self.hash_time_max * 1000, 2),
+        }
+
+hash_pool = HashPool(HASH_POOL_SIZE, HASH_QUEUE_LIMIT)
+
+async def hash_password(password: str) -> str:
+    return await hash_pool.run(pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password off the event loop. The second value is a fresh hash
+    when the stored one was made with outdated cost parameters.
+    """
+    valid, new_hash = await hash_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+    if new_hash:
+        hash_pool.rehashed += 1
+    return valid, new_hash
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import time
+from typing import Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.menu import MenuItem, MenuCategory, Category
+from utils.menu_version import read_version, etag_for
+
+# Seconds between checks of the shared menu version (writes by this worker apply at once)
+MENU_VERSION_CHECK_INTERVAL = float(os.getenv("MENU_VERSION_CHECK_INTERVAL", "1"))
+
+def _encode(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+class MenuSnapshot:
+    """
+    Immutable view of the whole menu at one version: serialized rows,
+    indexes by category and flags, and response bytes memoized per filter
+    combination. Replaced as a whole, never modified.
+    """
+
+    def __init__(self, version: int, items: list, categories: list):
+        self.version = version
+        self.items = tuple(items)
+        self.items_by_id = {item["id"]: item for item in items}
+        self.categories = tuple(categories)
+        self.categories_by_id = {category["id"]: category for category in categories}
+
+        self.by_category = {}
+        for item in items:
+            self.by_category.setdefault(item["category"], []).append(item)
+        self.by_category = {name: tuple(rows) for name, rows in self.by_category.items()}
+        self.by_vegetarian = {flag: frozenset(item["id"] for item in items if bool(item["is_vegetarian"]) is flag) for flag in (True, False)}
+        self.by_available = {flag: frozenset(item["id"] for item in items if bool(item["is_available"]) is flag) for flag in (True, False)}
+
+        self._responses = {}
+        # Warm the combinations kiosks and apps poll most
+        self.items_response(None, None, None)
+        self.items_response(None, None, True)
+        for category in Category:
+            self.items_response(category, None, True)
+        self.categories_response()
+
+    def _memo(self, key, build) -> Optional[Tuple[bytes, str]]:
+        cached = self._responses.get(key)
+        if cached is None:
+            value = build()
+            if value is None:
+                return None
+            body = _encode(value)
+            cached = self._responses[key] = (body, etag_for(body))
+        return cached
+
+    def filter_items(self, category: Optional[Category], is_vegetarian: Optional[bool], is_available: Optional[bool]) -> list:
+        rows = self.by_category.get(category.value, ()) if category else self.items
+        if is_vegetarian is not None:
+            ids = self.by_vegetarian[is_vegetarian]
+            rows = [item for item in rows if item["id"] in ids]
+        if is_available is not None:
+            ids = self.by_available[is_available]
+            rows = [item for item in rows if item["id"] in ids]
+        return list(rows)
+
+    def items_response(self, category: Optional[Category], is_vegetarian: Optional[bool], is_available: Optional[bool]) -> Tuple[bytes, str]:
+        return self._memo(
+            ("items", category, is_vegetarian, is_available),
+            lambda: self.filter_items(category, is_vegetarian, is_available),
+        )
+
+    def item_response(self, item_id: int) -> Optional[Tuple[bytes, str]]:
+        return self._memo(("item", item_id), lambda: self.items_by_id.get(item_id))
+
+    def categories_response(self) -> Tuple[bytes, str]:
+        return self._memo(("categories",), lambda: list(self.categories))
+
+    def category_response(self, category_id: int) -> Optional[Tuple[bytes, str]]:
+        return self._memo(("category", category_id), lambda: self.categories_by_id.get(category_id))
+
+class MenuStore:
+    """
+    Holds the current MenuSnapshot. Reads check the shared version at most
+    every check_interval seconds and reload only when it moved; menu writes
+    reload right after committing.
+    """
+
+    def __init__(self, item_schema, category_schema, check_interval: float = MENU_VERSION_CHECK_INTERVAL):
+        self.item_schema = item_schema
+        self.category_schema = category_schema
+        self.check_interval = check_interval
+        self.snapshot: Optional[MenuSnapshot] = None
+        self._checked_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.loads = 0
+        self.version_checks = 0
+
+    async def load(self, db: AsyncSession) -> MenuSnapshot:
+        # Read the version first: a write landing mid-load only makes the
+        # snapshot newer than its version, which triggers one extra reload
+        version = await read_version(db)
+        items = [
+            self.item_schema.model_validate(item).model_dump(mode="json")
+            for item in await db.scalars(select(MenuItem).order_by(MenuItem.id))
+        ]
+        categories = [
+            self.category_schema.model_validate(category).model_dump(mode="json")
+            for category in await db.scalars(select(MenuCategory).order_by(MenuCategory.display_order, MenuCategory.id))
+        ]
+        snapshot = MenuSnapshot(version, items, categories)
+        # Loads can overlap now that they await; never swap back to an older version
+        if self.snapshot is None or version >= self.snapshot.version:
+            self.snapshot = snapshot
+        self._checked_at = time.monotonic()
+        self.loads += 1
+        return self.snapshot
+
+    async def current(self, db: AsyncSession) -> MenuSnapshot:
+        snapshot = self.snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # One request checks (and reloads) while concurrent ones wait for it
+        async with self._lock:
+            if self.snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self.snapshot
+            if self.snapshot is None:
+                return await self.load(db)
+            self._checked_at = time.monotonic()
+            self.version_checks += 1
+            if await read_version(db) != self.snapshot.version:
+                return await self.load(db)
+            return self.snapshot
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "items": len(snapshot.items) if snapshot else 0,
+            "categories": len(snapshot.categories) if snapshot else 0,
+            "loads": self.loads,
+            "version_checks": self.version_checks,
+        }
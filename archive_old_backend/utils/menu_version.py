@@ -0,0 +1,58 @@
+import hashlib
+import os
+from fastapi import Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.menu import MenuState
+
+# How long clients may reuse a menu response before revalidating it
+MENU_MAX_AGE = int(os.getenv("MENU_MAX_AGE", "15"))
+
+MENU_STATE_ID = 1
+
+async def read_version(db: AsyncSession) -> int:
+    """The shared menu version; one primary-key lookup"""
+    return await db.scalar(select(MenuState.version).where(MenuState.id == MENU_STATE_ID)) or 0
+
+async def bump_version(db: AsyncSession):
+    """
+    Increment the shared menu version inside the caller's transaction, so
+    other workers see the change as soon as the write commits
+    """
+    result = await db.execute(
+        update(MenuState).where(MenuState.id == MENU_STATE_ID).values(version=MenuState.version + 1)
+    )
+    if not result.rowcount:
+        db.add(MenuState(id=MENU_STATE_ID, version=1))
+
+def etag_for(body: bytes) -> str:
+    # Strong ETag: identical bytes on every worker give the same tag
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+def _if_none_match(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+class MenuHTTPStats:
+    def __init__(self):
+        self.responses = 0
+        self.not_modified = 0
+
+    def stats(self) -> dict:
+        return {"responses": self.responses, "not_modified": self.not_modified}
+
+http_stats = MenuHTTPStats()
+
+def cached_response(request: Request, body: bytes, etag: str) -> Response:
+    """
+    Send pre-serialized menu JSON with its ETag and Cache-Control, or a
+    304 when the client already has these bytes
+    """
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={MENU_MAX_AGE}, must-revalidate"}
+    http_stats.responses += 1
+    if _if_none_match(request, etag):
+        http_stats.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
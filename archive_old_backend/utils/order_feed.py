@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, FrozenSet, Optional
+
+# Events kept for clients resuming with Last-Event-ID
+ORDER_FEED_REPLAY_SIZE = int(os.getenv("ORDER_FEED_REPLAY_SIZE", "1000"))
+# Events queued per subscriber before it is treated as slow and caught up from the replay buffer
+ORDER_FEED_QUEUE_SIZE = int(os.getenv("ORDER_FEED_QUEUE_SIZE", "100"))
+ORDER_FEED_MAX_SUBSCRIBERS = int(os.getenv("ORDER_FEED_MAX_SUBSCRIBERS", "1000"))
+# Seconds between keepalive comments on an idle stream
+ORDER_FEED_KEEPALIVE = float(os.getenv("ORDER_FEED_KEEPALIVE", "15"))
+
+class FeedEvent:
+    """One order change, serialized to an SSE frame once and shared by every subscriber"""
+    __slots__ = ("seq", "status", "previous_status", "is_takeout", "frame")
+
+    def __init__(self, epoch: str, seq: int, kind: str, order: dict, previous_status: Optional[str]):
+        self.seq = seq
+        self.status = order.get("status")
+        self.previous_status = previous_status
+        self.is_takeout = order.get("is_takeout")
+        data = json.dumps({"type": kind, "previous_status": previous_status, "order": order}, separators=(",", ":"))
+        self.frame = f"id: {epoch}-{seq}\nevent: {kind}\ndata: {data}\n\n".encode()
+
+class Subscriber:
+    def __init__(self, statuses: Optional[FrozenSet[str]], is_takeout: Optional[bool], last_seq: int):
+        self.statuses = statuses
+        self.is_takeout = is_takeout
+        self.queue: asyncio.Queue = asyncio.Queue(ORDER_FEED_QUEUE_SIZE)
+        # Highest event already queued or sent; catch-up replays from here
+        self.last_seq = last_seq
+        self.lagging = False
+
+    def matches(self, event: FeedEvent) -> bool:
+        # An order leaving a watched status is still news to that screen
+        if self.statuses is not None and event.status not in self.statuses and event.previous_status not in self.statuses:
+            return False
+        return self.is_takeout is None or event.is_takeout == self.is_takeout
+
+class OrderFeed:
+    """
+    In-process fan-out of order changes to live subscribers (kitchen and
+    front-of-house screens), with a replay buffer for reconnects. Publishing
+    never waits on a subscriber: one whose queue is full stops receiving
+    and catches up from the replay buffer once it has drained, or gets a
+    reset event when the buffer has moved past it.
+
+    Each worker only sees the writes it handled itself.
+    """
+
+    def __init__(self, replay_size: int = ORDER_FEED_REPLAY_SIZE):
+        # Changes on restart, so event ids from an earlier process trigger a reset
+        self.epoch = format(time.time_ns(), "x")
+        self.seq = 0
+        self.replay = deque(maxlen=replay_size)
+        self.subscribers = set()
+        self.published = 0
+        self.delivered = 0
+        self.lagged = 0
+        self.resets = 0
+
+    def publish(self, kind: str, order: dict, previous_status: Optional[str] = None):
+        self.seq += 1
+        event = FeedEvent(self.epoch, self.seq, kind, order, previous_status)
+        self.replay.append(event)
+        self.published += 1
+        for subscriber in self.subscribers:
+            if subscriber.lagging or not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.lagging = True
+                self.lagged += 1
+                continue
+            subscriber.last_seq = event.seq
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """The sequence number to resume after, or None when the id is not from this process"""
+        if not event_id:
+            return None
+        epoch, _, seq = event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        return int(seq)
+
+    def _since(self, subscriber: Subscriber, seq: int) -> Optional[list]:
+        """Buffered events after seq for this subscriber, or None when some were already dropped"""
+        if seq < self.seq and (not self.replay or self.replay[0].seq > seq + 1):
+            return None
+        return [event for event in self.replay if event.seq > seq and subscriber.matches(event)]
+
+    async def stream(
+        self,
+        statuses: Optional[FrozenSet[str]] = None,
+        is_takeout: Optional[bool] = None,
+        last_event_id: Optional[str] = None,
+    ) -> AsyncIterator[bytes]:
+        """SSE frames for one subscriber until the client disconnects"""
+        subscriber = Subscriber(statuses, is_takeout, self.seq)
+        # Collected before the first yield so nothing is both replayed and queued
+        missed = []
+        if last_event_id:
+            resume_after = self.parse_event_id(last_event_id)
+            missed = self._since(subscriber, resume_after) if resume_after is not None else None
+        self.subscribers.add(subscriber)
+        try:
+            yield b"retry: 3000\n\n"
+            if missed is None:
+                yield self._reset()
+            else:
+                for event in missed:
+                    self.delivered += 1
+                    yield event.frame
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), ORDER_FEED_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                self.delivered += 1
+                yield event.frame
+                if subscriber.lagging and subscriber.queue.empty():
+                    # No await between collecting and clearing the flag, so nothing is missed
+                    missed = self._since(subscriber, subscriber.last_seq)
+                    subscriber.last_seq = self.seq
+                    subscriber.lagging = False
+                    if missed is None:
+                        yield self._reset()
+                    else:
+                        for event in missed:
+                            self.delivered += 1
+                            yield event.frame
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def _reset(self) -> bytes:
+        # Tells the client to reload its orders with GET /api/orders and keep listening
+        self.resets += 1
+        return f"id: {self.epoch}-{self.seq}\nevent: reset\ndata: {{}}\n\n".encode()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "lagged": self.lagged,
+            "resets": self.resets,
+            "replay_buffered": len(self.replay),
+        }
+
+order_feed = OrderFeed()
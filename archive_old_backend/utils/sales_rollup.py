@@ -0,0 +1,221 @@
+"""
+Sales rollups: revenue, order counts and quantities per hour for each menu
+item, category and payment method, kept in the sales_rollups table.
+
+The order handlers apply each change in the same transaction as the order
+write, so reports never drift from the orders they summarize. Sales count
+under the category stored on each order line when the order was placed, so
+moving an item to another category does not move its past sales. Rebuild from
+the full order history (after a schema change or a manual data fix) with:
+
+    python -m utils.sales_rollup
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.menu import MenuItem
+from models.order import Order, OrderItem, PaymentStatus
+from models.report import SalesRollup
+
+# Orders read per query while rebuilding
+SALES_ROLLUP_REBUILD_BATCH = int(os.getenv("SALES_ROLLUP_REBUILD_BATCH", "1000"))
+
+MEASURES = ("orders", "quantity", "revenue", "paid_orders", "paid_revenue")
+
+class SaleLine(NamedTuple):
+    menu_item_id: int
+    category: Optional[str]
+    quantity: int
+    total_price: float
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _value(value) -> Optional[str]:
+    return value.value if hasattr(value, "value") else value
+
+def _lines_query():
+    # Lines from before categories were stored on them fall back to the item's current category
+    return (
+        select(
+            OrderItem.id, OrderItem.order_id, OrderItem.menu_item_id, OrderItem.category,
+            MenuItem.category.label("menu_category"), OrderItem.quantity, OrderItem.total_price,
+        )
+        .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+    )
+
+def _line(row) -> SaleLine:
+    return SaleLine(row.menu_item_id, row.category or _value(row.menu_category), row.quantity, row.total_price)
+
+def contributions(order: Order, lines: Iterable[SaleLine], placed: int, paid: int) -> dict:
+    """
+    Rollup deltas for one order, keyed by (hour, dimension, key). `placed`
+    is +1/-1 when the order is created/deleted, `paid` is +1/-1 when it
+    becomes/stops being paid.
+    """
+    per_key = {}
+    quantity = 0
+    for line in lines:
+        quantity += line.quantity
+        for key in (("item", str(line.menu_item_id)), ("category", _value(line.category) or "unknown")):
+            entry = per_key.setdefault(key, [0, 0.0])
+            entry[0] += line.quantity
+            entry[1] += line.total_price
+    per_key[("payment_method", _value(order.payment_method) or "unspecified")] = [quantity, order.total_amount or 0.0]
+
+    hour = hour_bucket(order.created_at)
+    return {
+        (hour, dimension, key): (placed, quantity * placed, revenue * placed, paid, revenue * paid)
+        for (dimension, key), (quantity, revenue) in per_key.items()
+    }
+
+async def _upsert(db: AsyncSession, deltas: dict):
+    if not deltas:
+        return
+    table = SalesRollup.__table__
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["dimension", "hour", "key"],
+        set_={measure: table.c[measure] + stmt.excluded[measure] for measure in MEASURES},
+    )
+    # Sorted so concurrent orders lock shared rows in the same order
+    rows = [
+        {"hour": hour, "dimension": dimension, "key": key, **dict(zip(MEASURES, values))}
+        for (hour, dimension, key), values in sorted(deltas.items())
+    ]
+    await db.execute(stmt, rows)
+
+async def order_lines(db: AsyncSession, order_id: int) -> List[SaleLine]:
+    rows = await db.execute(_lines_query().where(OrderItem.order_id == order_id))
+    return [_line(row) for row in rows]
+
+async def record_order(db: AsyncSession, order: Order, lines: Iterable[SaleLine], sign: int = 1):
+    """
+    Add (sign=1, on create) or remove (sign=-1, on delete, with the order
+    row locked) a flushed order; the caller commits
+    """
+    paid = sign if order.payment_status == PaymentStatus.PAID else 0
+    await _upsert(db, contributions(order, lines, sign, paid))
+
+async def record_payment(db: AsyncSession, order: Order, previous: Optional[PaymentStatus]):
+    """
+    Move an order's revenue into or out of the paid measures. The caller
+    must have loaded the order with a row lock, so `previous` cannot be
+    stale, and commits.
+    """
+    was_paid = previous == PaymentStatus.PAID
+    is_paid = order.payment_status == PaymentStatus.PAID
+    if was_paid == is_paid:
+        return
+    lines = await order_lines(db, order.id)
+    await _upsert(db, contributions(order, lines, 0, 1 if is_paid else -1))
+
+async def rebuild(db: AsyncSession, batch_size: int = SALES_ROLLUP_REBUILD_BATCH) -> int:
+    """
+    Recompute every rollup from order history in one transaction, so
+    reports keep answering from the old rows until it commits. Lines
+    without a stored category get the one they are rebuilt under, so later
+    payment changes and deletes book to the same rows.
+    """
+    deltas = {}
+    last_id = 0
+    count = 0
+    while True:
+        orders = (await db.scalars(
+            select(Order).where(Order.id > last_id).order_by(Order.id).limit(batch_size)
+        )).all()
+        if not orders:
+            break
+        lines = {}
+        backfill = []
+        rows = await db.execute(_lines_query().where(OrderItem.order_id.in_([order.id for order in orders])))
+        for row in rows:
+            line = _line(row)
+            lines.setdefault(row.order_id, []).append(line)
+            if row.category is None and line.category is not None:
+                backfill.append({"id": row.id, "category": line.category})
+        if backfill:
+            await db.execute(update(OrderItem), backfill)
+        for order in orders:
+            paid = 1 if order.payment_status == PaymentStatus.PAID else 0
+            for key, values in contributions(order, lines.get(order.id, ()), 1, paid).items():
+                current = deltas.get(key)
+                deltas[key] = values if current is None else tuple(a + b for a, b in zip(current, values))
+        count += len(orders)
+        last_id = orders[-1].id
+        db.expunge_all()
+
+    await db.execute(delete(SalesRollup))
+    if deltas:
+        await db.execute(insert(SalesRollup), [
+            {"hour": hour, "dimension": dimension, "key": key, **dict(zip(MEASURES, values))}
+            for (hour, dimension, key), values in deltas.items()
+        ])
+    await db.commit()
+    return count
+
+def _totals(row) -> dict:
+    return {
+        "orders": row.orders or 0,
+        "quantity": row.quantity or 0,
+        "revenue": round(row.revenue or 0.0, 2),
+        "paid_orders": row.paid_orders or 0,
+        "paid_revenue": round(row.paid_revenue or 0.0, 2),
+    }
+
+async def sales_report(db: AsyncSession, group_by: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+    """
+    Sales between start (inclusive) and end (exclusive), to the hour,
+    grouped by item, category, payment_method or hour. Reads only rollup rows, so the cost
+    depends on the hours and keys in range, not on the number of orders.
+    """
+    measures = [func.sum(getattr(SalesRollup, measure)).label(measure) for measure in MEASURES]
+    dimension = "payment_method" if group_by == "hour" else group_by
+    column = SalesRollup.hour if group_by == "hour" else SalesRollup.key
+
+    def in_range(query, dimension: str):
+        query = query.where(SalesRollup.dimension == dimension)
+        if start:
+            query = query.where(SalesRollup.hour >= hour_bucket(start))
+        if end:
+            query = query.where(SalesRollup.hour < end)
+        return query
+
+    rows = (await db.execute(
+        in_range(select(column.label("key"), *measures), dimension)
+        .group_by(column)
+        # Keys whose orders were all deleted keep a zeroed row until the next rebuild
+        .having(func.sum(SalesRollup.orders) != 0)
+        .order_by(column)
+    )).all()
+    groups = [{"key": row.key.isoformat() if group_by == "hour" else row.key, **_totals(row)} for row in rows]
+    if dimension == "payment_method":
+        totals = {measure: sum(group[measure] for group in groups) for measure in MEASURES}
+        totals["revenue"] = round(totals["revenue"], 2)
+        totals["paid_revenue"] = round(totals["paid_revenue"], 2)
+    else:
+        # Every order counts once under payment_method, so that dimension gives the totals
+        totals = _totals((await db.execute(in_range(select(*measures), "payment_method"))).one())
+    return {"group_by": group_by, "start": start, "end": end, "totals": totals, "groups": groups}
+
+async def main():
+    from database import SessionLocal, engine, create_tables
+    import models.user  # noqa: F401 -- Order.user refers to it
+    await create_tables()
+    try:
+        async with SessionLocal() as db:
+            started = datetime.utcnow()
+            count = await rebuild(db)
+        print(f"Rebuilt sales rollups from {count} orders in {(datetime.utcnow() - started).total_seconds():.1f}s")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Rebuild the sales rollups from order history").parse_args()
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import math
+import os
+from typing import AsyncIterator, Callable, Optional
+
+# Expected number of indexed values (emails + usernames) and target false-positive rate
+AVAILABILITY_EXPECTED_ITEMS = int(os.getenv("AVAILABILITY_EXPECTED_ITEMS", "200000"))
+AVAILABILITY_FALSE_POSITIVE_RATE = float(os.getenv("AVAILABILITY_FALSE_POSITIVE_RATE", "0.01"))
+# Seconds between full rebuilds from the users table (0 disables)
+AVAILABILITY_REBUILD_INTERVAL = float(os.getenv("AVAILABILITY_REBUILD_INTERVAL", "600"))
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings. Membership tests can return false
+    positives but never false negatives.
+    """
+
+    def __init__(self, expected_items: int, false_positive_rate: float):
+        expected_items = max(1, expected_items)
+        self.size = max(64, int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / expected_items * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        # Double hashing: two 64-bit halves of one digest give all k positions
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+def _key(field: str, value: str) -> str:
+    return f"{field}:{value}"
+
+class AvailabilityIndex:
+    """
+    In-memory index of taken emails and usernames. A miss means the value is
+    definitely free (as of the last load plus local writes); a hit only means
+    it might be taken and has to be confirmed upstream.
+
+    Bloom filters cannot forget values, so deletes and renames are picked up
+    by the periodic rebuild; until then the old value just costs an upstream check.
+    """
+
+    def __init__(self, expected_items: int, false_positive_rate: float, rebuild_interval: float):
+        self.expected_items = expected_items
+        self.false_positive_rate = false_positive_rate
+        self.rebuild_interval = rebuild_interval
+        self._filter: Optional[BloomFilter] = None
+        self._building: Optional[BloomFilter] = None
+        self._task: Optional[asyncio.Task] = None
+        self.rebuilds = 0
+        self.failed_rebuilds = 0
+        self.stale_values = 0
+        self.local_answers = 0
+        self.upstream_checks = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def might_contain(self, field: str, value: str) -> bool:
+        """False only when the value is known to be unused; True while not loaded"""
+        if self._filter is None:
+            return True
+        return _key(field, value) in self._filter
+
+    def record_lookup(self, local: bool):
+        if local:
+            self.local_answers += 1
+        else:
+            self.upstream_checks += 1
+
+    def add(self, email: Optional[str] = None, username: Optional[str] = None):
+        """Mark values as taken, including in a rebuild that is in progress"""
+        for field, value in (("email", email), ("username", username)):
+            if not value:
+                continue
+            for bloom in (self._filter, self._building):
+                if bloom is not None:
+                    bloom.add(_key(field, value))
+
+    def discard(self, count: int = 1):
+        """Note values that may have been freed; they stay indexed until the next rebuild"""
+        self.stale_values += count
+
+    async def rebuild(self, load: Callable[[], AsyncIterator[tuple]]):
+        """
+        Build a new filter from (email, username) pairs and swap it in.
+        Writes made while loading are added to both filters.
+        """
+        previous = self._filter.count if self._filter else 0
+        self._building = BloomFilter(max(self.expected_items, previous * 2), self.false_positive_rate)
+        try:
+            async for email, username in load():
+                for field, value in (("email", email), ("username", username)):
+                    if value:
+                        self._building.add(_key(field, value))
+        except Exception as e:
+            self.failed_rebuilds += 1
+            print(f"Availability index rebuild failed: {e!r}")
+            return
+        finally:
+            building, self._building = self._building, None
+        self._filter = building
+        self.stale_values = 0
+        self.rebuilds += 1
+
+    async def _run(self, load: Callable[[], AsyncIterator[tuple]]):
+        while True:
+            await self.rebuild(load)
+            if self.rebuild_interval <= 0:
+                return
+            await asyncio.sleep(self.rebuild_interval)
+
+    def start(self, load: Callable[[], AsyncIterator[tuple]]):
+        """Load in the background and keep rebuilding; lookups go upstream until ready"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(load))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        bloom = self._filter
+        return {
+            "ready": self.ready,
+            "items": bloom.count if bloom else 0,
+            "bits": bloom.size if bloom else 0,
+            "hash_count": bloom.hash_count if bloom else 0,
+            "rebuilding": self._building is not None,
+            "rebuilds": self.rebuilds,
+            "failed_rebuilds": self.failed_rebuilds,
+            "stale_values": self.stale_values,
+            "local_answers": self.local_answers,
+            "upstream_checks": self.upstream_checks,
+        }
+
+availability_index = AvailabilityIndex(AVAILABILITY_EXPECTED_ITEMS, AVAILABILITY_FALSE_POSITIVE_RATE, AVAILABILITY_REBUILD_INTERVAL)
@@ -0,0 +1,121 @@
+"""
+Offline load test for the API's request paths.
+
+Runs main.app in-process against fake_postgrest.app (no network) and
+reports throughput and latency percentiles per endpoint:
+
+    python benchmark.py --requests 2000 --concurrency 50 --latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import httpx
+
+# Tokens minted here never leave the process; main refuses to start without a secret
+os.environ.setdefault("SESSION_SECRET", "offline-benchmark-secret")
+
+import fake_postgrest
+import supabase_client
+import main
+import rate_limit
+
+FAKE_URL = "http://fake-postgrest"
+FAKE_KEY = "fake-key"
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def is_error_body(response: httpx.Response) -> bool:
+    # The API reports upstream failures as {"error": ...} with a 200 status
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and "error" in body
+
+async def run_load(client: httpx.AsyncClient, method: str, path: str, total: int, concurrency: int, body_for=None) -> dict:
+    latencies, errors = [], 0
+    queue = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in queue:
+            kwargs = {"json": body_for(i)} if body_for else {}
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400 or is_error_body(response):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "endpoint": f"{method} {path}",
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+    }
+
+async def seed_users(count: int):
+    for i in range(count):
+        fake_postgrest.db.insert("users", {
+            "full_name": f"User {i}",
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "password": "Password1",
+            "phone_number": "5550000",
+        })
+
+async def main_async(args):
+    fake_postgrest.db.reset()
+    fake_postgrest.config.latency_ms = args.latency_ms
+    fake_postgrest.config.jitter_ms = args.jitter_ms
+    fake_postgrest.config.error_rate = args.error_rate
+    supabase_client.SUPABASE_URL = FAKE_URL
+    # fake_postgrest ignores the key, but httpx rejects the None headers left by an unset SUPABASE_API_KEY
+    fake_key = {"apikey": FAKE_KEY, "Authorization": f"Bearer {FAKE_KEY}"}
+    supabase_client.headers.update(fake_key)
+    supabase_client.representation_headers.update(fake_key)
+    # All load comes from one client, so the per-IP/per-account limits would reject it
+    rate_limit.ip_limiter.burst = rate_limit.identity_limiter.burst = float("inf")
+    await supabase_client.init_http_client(httpx.ASGITransport(app=fake_postgrest.app))
+    await seed_users(args.users)
+
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://api") as client:
+        results.append(await run_load(
+            client, "POST", "/auth/login", args.requests, args.concurrency,
+            lambda i: {"username": f"user{i % args.users}", "password": "Password1"},
+        ))
+        results.append(await run_load(
+            client, "POST", "/signup", args.requests, args.concurrency,
+            lambda i: {
+                "fullName": f"New {i}", "username": f"new{i}", "email": f"new{i}@example.com",
+                "password": "Password1", "phoneNumber": "5550000",
+            },
+        ))
+        results.append(await run_load(client, "GET", f"/users?limit={args.page_size}", args.requests, args.concurrency))
+
+    await supabase_client.close_http_client()
+    for result in results:
+        print(result)
+    print({"upstream_requests": fake_postgrest.db.requests})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    asyncio.run(main_async(parser.parse_args()))
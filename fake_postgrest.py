@@ -0,0 +1,319 @@
+"""
+In-memory stand-in for the Supabase PostgREST API, for offline benchmarking.
+
+Run it and point the API at it:
+
+    python fake_postgrest.py                      # listens on :54321
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_API_KEY=fake uvicorn main:app
+
+It implements the subset of PostgREST used by supabase_client.py and
+app/database.py: the users and login tables, select projection, eq/neq/
+gt/gte/lt/lte/in/is filters, or=(...), order, limit/offset, inserts
+(single and bulk), patches and deletes, the users UNIQUE constraints and
+Prefer: return=representation.
+
+Latency and failures can be injected with FAKE_POSTGREST_LATENCY_MS,
+FAKE_POSTGREST_JITTER_MS, FAKE_POSTGREST_ERROR_RATE and FAKE_POSTGREST_SEED,
+or at runtime through POST /_fake/config. POST /_fake/reset empties the
+tables.
+"""
+import asyncio
+import os
+import random
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+FAKE_POSTGREST_PORT = int(os.getenv("FAKE_POSTGREST_PORT", "54321"))
+
+# Column defaults and UNIQUE constraints, mirroring create_users_table.sql
+TABLES = {
+    "users": {
+        "defaults": {"phone_number": None, "role": "customer", "is_active": True},
+        "unique": ("username", "email"),
+        "timestamps": ("created_at", "updated_at"),
+    },
+    "login": {
+        "defaults": {},
+        "unique": (),
+        "timestamps": ("created_at",),
+    },
+}
+
+class FakeConfig:
+    def __init__(self):
+        self.latency_ms = float(os.getenv("FAKE_POSTGREST_LATENCY_MS", "0"))
+        self.jitter_ms = float(os.getenv("FAKE_POSTGREST_JITTER_MS", "0"))
+        self.error_rate = float(os.getenv("FAKE_POSTGREST_ERROR_RATE", "0"))
+        self.error_status = int(os.getenv("FAKE_POSTGREST_ERROR_STATUS", "503"))
+        self.seed = int(os.getenv("FAKE_POSTGREST_SEED", "0"))
+        self.random = random.Random(self.seed)
+
+    def as_dict(self) -> dict:
+        return {
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "error_rate": self.error_rate,
+            "error_status": self.error_status,
+            "seed": self.seed,
+        }
+
+class FakeDatabase:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rows = {name: [] for name in TABLES}
+        self.next_id = {name: 1 for name in TABLES}
+        self.requests = 0
+
+    def insert(self, table: str, record: dict) -> dict:
+        spec = TABLES[table]
+        for column in spec["unique"]:
+            value = record.get(column)
+            if value is not None and any(row.get(column) == value for row in self.rows[table]):
+                raise UniqueViolation(table, column, value)
+        now = datetime.now(timezone.utc).isoformat()
+        row = {"id": self.next_id[table], **spec["defaults"]}
+        row.update({column: now for column in spec["timestamps"]})
+        row.update(record)
+        self.next_id[table] = max(self.next_id[table], int(row["id"])) + 1
+        self.rows[table].append(row)
+        return row
+
+class UniqueViolation(Exception):
+    def __init__(self, table: str, column: str, value):
+        self.table = table
+        self.column = column
+        self.value = value
+        super().__init__(f'duplicate key value violates unique constraint "{table}_{column}_key"')
+
+config = FakeConfig()
+db = FakeDatabase()
+
+app = FastAPI(title="Fake PostgREST")
+
+# Filter parsing
+def _split_top_level(text: str) -> list:
+    """Split on commas that are outside parentheses and double quotes"""
+    parts, depth, quoted, current = [], 0, False, []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and quoted and i + 1 < len(text):
+            current.append(text[i + 1])
+            i += 2
+            continue
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    parts.append("".join(current))
+    return parts
+
+def _unquote(text: str) -> str:
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1]
+    return text
+
+def _coerce(row_value, text: str):
+    """Convert a filter literal to the type of the stored value"""
+    if isinstance(row_value, bool):
+        return text.lower() == "true"
+    try:
+        if isinstance(row_value, int):
+            return int(text)
+        if isinstance(row_value, float):
+            return float(text)
+    except ValueError:
+        return text
+    return text
+
+def _matches(row: dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    operator, _, operand = expression.partition(".")
+    value = row.get(column)
+    if operator == "is":
+        result = value is None if operand == "null" else value is (operand == "true")
+    elif operator == "in":
+        options = [_unquote(option) for option in _split_top_level(operand.strip("()"))]
+        result = value is not None and value in [_coerce(value, option) for option in options]
+    elif value is None:
+        result = False
+    else:
+        target = _coerce(value, _unquote(operand))
+        if operator == "eq":
+            result = value == target
+        elif operator == "neq":
+            result = value != target
+        elif operator == "gt":
+            result = value > target
+        elif operator == "gte":
+            result = value >= target
+        elif operator == "lt":
+            result = value < target
+        elif operator == "lte":
+            result = value <= target
+        else:
+            raise ValueError(f"unsupported operator: {operator}")
+    return not result if negate else result
+
+def _matches_or(row: dict, expression: str) -> bool:
+    for condition in _split_top_level(expression.strip("()")):
+        column, _, rest = condition.partition(".")
+        if _matches(row, column, rest):
+            return True
+    return False
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+def _filter_rows(table: str, params) -> list:
+    rows = db.rows[table]
+    for key, expression in params.multi_items():
+        if key in RESERVED_PARAMS:
+            continue
+        if key == "or":
+            rows = [row for row in rows if _matches_or(row, expression)]
+        else:
+            rows = [row for row in rows if _matches(row, key, expression)]
+    return rows
+
+def _shape(rows: list, params) -> list:
+    order = params.get("order")
+    if order:
+        for clause in reversed(order.split(",")):
+            column, _, direction = clause.partition(".")
+            rows = sorted(
+                rows,
+                key=lambda row: (row.get(column) is None, row.get(column)),
+                reverse=direction.startswith("desc"),
+            )
+    offset = int(params.get("offset", 0))
+    limit = params.get("limit")
+    rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+    select = params.get("select", "*")
+    if select != "*":
+        columns = [column.strip() for column in select.split(",")]
+        rows = [{column: row.get(column) for column in columns} for row in rows]
+    return rows
+
+def _wants_representation(request: Request) -> bool:
+    return "return=representation" in request.headers.get("prefer", "")
+
+def _error(status_code: int, message: str, code: Optional[str] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"code": code, "message": message, "details": None, "hint": None},
+    )
+
+@app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    if request.url.path.startswith("/_fake"):
+        return await call_next(request)
+    db.requests += 1
+    delay = config.latency_ms + config.random.uniform(0, config.jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    if config.error_rate and config.random.random() < config.error_rate:
+        return _error(config.error_status, "Injected failure", "FAKE")
+    return await call_next(request)
+
+@app.get("/rest/v1/{table}")
+async def select_rows(table: str, request: Request):
+    if table not in TABLES:
+        return _error(404, f'relation "public.{table}" does not exist', "42P01")
+    try:
+        rows = _filter_rows(table, request.query_params)
+    except ValueError as e:
+        return _error(400, str(e), "PGRST100")
+    rows = _shape(rows, request.query_params)
+    offset = int(request.query_params.get("offset", 0))
+    content_range = f"{offset}-{offset + len(rows) - 1}/*" if rows else "*/*"
+    return JSONResponse(content=rows, headers={"Content-Range": content_range})
+
+@app.post("/rest/v1/{table}")
+async def insert_rows(table: str, request: Request):
+    if table not in TABLES:
+        return _error(404, f'relation "public.{table}" does not exist', "42P01")
+    payload = await request.json()
+    records = payload if isinstance(payload, list) else [payload]
+    # Inserts are all-or-nothing, like a single INSERT statement
+    snapshot = (list(db.rows[table]), db.next_id[table])
+    try:
+        inserted = [db.insert(table, record) for record in records]
+    except UniqueViolation as e:
+        db.rows[table], db.next_id[table] = snapshot
+        return _error(409, str(e), "23505")
+    if _wants_representation(request):
+        return JSONResponse(status_code=201, content=_shape(inserted, request.query_params))
+    return Response(status_code=201)
+
+@app.patch("/rest/v1/{table}")
+async def update_rows(table: str, request: Request):
+    if table not in TABLES:
+        return _error(404, f'relation "public.{table}" does not exist', "42P01")
+    payload = await request.json()
+    rows = _filter_rows(table, request.query_params)
+    for column in TABLES[table]["unique"]:
+        if column in payload and len(rows) > 0:
+            others = [row for row in db.rows[table] if row not in rows]
+            if len(rows) > 1 or any(row.get(column) == payload[column] for row in others):
+                return _error(409, str(UniqueViolation(table, column, payload[column])), "23505")
+    for row in rows:
+        row.update(payload)
+        if "updated_at" in TABLES[table]["timestamps"]:
+            row["updated_at"] = datetime.now(timezone.utc).isoformat()
+    if _wants_representation(request):
+        return _shape(rows, request.query_params)
+    return Response(status_code=204)
+
+@app.delete("/rest/v1/{table}")
+async def delete_rows(table: str, request: Request):
+    if table not in TABLES:
+        return _error(404, f'relation "public.{table}" does not exist', "42P01")
+    rows = _filter_rows(table, request.query_params)
+    removed = {id(row) for row in rows}
+    db.rows[table] = [row for row in db.rows[table] if id(row) not in removed]
+    if _wants_representation(request):
+        return _shape(rows, request.query_params)
+    return Response(status_code=204)
+
+# Control endpoints (not part of PostgREST)
+@app.get("/_fake/config")
+async def get_config():
+    return {**config.as_dict(), "requests": db.requests}
+
+@app.post("/_fake/config")
+async def set_config(request: Request):
+    updates = await request.json()
+    for key in ("latency_ms", "jitter_ms", "error_rate"):
+        if key in updates:
+            setattr(config, key, float(updates[key]))
+    if "error_status" in updates:
+        config.error_status = int(updates["error_status"])
+    if "seed" in updates:
+        config.seed = int(updates["seed"])
+        config.random = random.Random(config.seed)
+    return config.as_dict()
+
+@app.post("/_fake/reset")
+async def reset():
+    db.reset()
+    config.random = random.Random(config.seed)
+    return {"status": "reset"}
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("fake_postgrest:app", host="127.0.0.1", port=FAKE_POSTGREST_PORT, reload=False)
@@ -1,13 +1,56 @@
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from supabase_client import fetch_login_data, insert_login_data, delete_login_data, update_login_data, signup_user, fetch_users, login_user
+from fastapi.responses import JSONResponse, StreamingResponse
+from supabase_client import (
+    insert_login_data, delete_login_data, update_login_data, signup_user, login_user,
+    init_http_client, close_http_client,
+    fetch_login_data_raw, fetch_users_raw, stream_login_data, stream_users,
+    bulk_insert_login_data, bulk_update_login_data, bulk_delete_login_data,
+    check_availability, iter_user_identities,
+)
+from user_cache import user_cache
+from upstream_policy import upstream
+from single_flight import upstream_reads
+from session_tokens import get_session, verified_tokens
+from availability_index import availability_index
+import rate_limit
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 print("🚀 Starting Mexican Restaurant API...")
 print(f"🌍 Environment: {'Production' if os.getenv('PORT') else 'Development'}")
 print(f"🔌 Port: {os.getenv('PORT', '8000')}")
 
-app = FastAPI(title="Mexican Restaurant API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open one pooled Supabase client for the whole process and close it on shutdown
+    await init_http_client()
+    # Load the username/email availability index in the background
+    availability_index.start(iter_user_identities)
+    yield
+    await availability_index.stop()
+    await close_http_client()
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed"""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(
+    title="Mexican Restaurant API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 # CORS middleware for production
 app.add_middleware(
@@ -30,9 +73,22 @@ app.add_middleware(
 async def root():
     return {"message": "Mexican Restaurant API is running", "status": "healthy"}
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def relay_page(page):
+    # Pass the upstream JSON body straight through instead of parsing and re-encoding it
+    if isinstance(page, dict):
+        return page
+    response = Response(content=page.content, media_type=page.content_type)
+    if page.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(page.next_cursor)
+    return response
+
 @app.get("/login")
-async def get_logins():
-    return await fetch_login_data()
+async def get_logins(limit: Optional[int] = None, after: Optional[int] = None, stream: bool = False):
+    if stream:
+        return StreamingResponse(stream_login_data(after), media_type=NDJSON_MEDIA_TYPE)
+    return relay_page(await fetch_login_data_raw(limit, after))
 
 @app.post("/login")
 async def create_login(request: Request):
@@ -51,19 +107,73 @@ async def remove_login(request: Request):
     condition = await request.json()
     return await delete_login_data(condition)
 
+# Batch variants: the body is a JSON array and each item gets its own result
+@app.post("/login/batch")
+async def create_logins(request: Request):
+    records = await request.json()
+    return await bulk_insert_login_data(records)
+
+@app.put("/login/batch")
+async def update_logins(request: Request):
+    items = await request.json()
+    return await bulk_update_login_data(items)
+
+@app.delete("/login/batch")
+async def remove_logins(request: Request):
+    conditions = await request.json()
+    return await bulk_delete_login_data(conditions)
+
+# Credential endpoints are rate limited per client IP and per target account
+# before any upstream call is made
 @app.post("/signup")
 async def signup(request: Request):
+    rejected = rate_limit.limit_ip(request, "signup")
+    if rejected:
+        return rejected
     user_data = await request.json()
+    rejected = rate_limit.limit_identities("signup", (user_data.get("email"), user_data.get("username")))
+    if rejected:
+        return rejected
     return await signup_user(user_data)
 
+@app.get("/signup/available")
+async def signup_available(email: Optional[str] = None, username: Optional[str] = None):
+    # Called as the user types; most answers come from the in-memory index
+    return await check_availability(email, username)
+
 @app.post("/auth/login")
 async def login(request: Request):
+    rejected = rate_limit.limit_ip(request, "login")
+    if rejected:
+        return rejected
     login_data = await request.json()
+    rejected = rate_limit.limit_identities("login", (login_data.get("email") or login_data.get("username"),))
+    if rejected:
+        return rejected
     return await login_user(login_data)
 
+@app.get("/auth/session")
+async def current_session(session: dict = Depends(get_session)):
+    # Authorized from the signed token alone, without a Supabase round trip
+    return session
+
 @app.get("/users")
-async def get_users():
-    return await fetch_users()
+async def get_users(limit: Optional[int] = None, after: Optional[int] = None, stream: bool = False):
+    if stream:
+        return StreamingResponse(stream_users(after), media_type=NDJSON_MEDIA_TYPE)
+    return relay_page(await fetch_users_raw(limit, after))
+
+# Internal cache and performance counters
+@app.get("/metrics")
+async def metrics():
+    return {
+        "user_cache": user_cache.stats(),
+        "upstream": upstream.stats(),
+        "single_flight": upstream_reads.stats(),
+        "verified_tokens": verified_tokens.stats(),
+        "rate_limit": rate_limit.stats(),
+        "availability_index": availability_index.stats(),
+    }
 
 # Add a health check endpoint
 @app.get("/health")
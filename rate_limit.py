@@ -0,0 +1,101 @@
+import os
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+# Per client IP: burst size and sustained requests per second
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "2"))
+# Per target email/username
+RATE_LIMIT_IDENTITY_BURST = float(os.getenv("RATE_LIMIT_IDENTITY_BURST", "5"))
+RATE_LIMIT_IDENTITY_RATE = float(os.getenv("RATE_LIMIT_IDENTITY_RATE", "0.2"))
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+# Keys tracked per shard; the least recently seen are dropped first
+RATE_LIMIT_KEYS_PER_SHARD = int(os.getenv("RATE_LIMIT_KEYS_PER_SHARD", "10000"))
+# Use the first X-Forwarded-For hop as the client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes")
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by string, spread over shards so each shard stays
+    small and can evict its idle keys cheaply
+    """
+
+    def __init__(self, burst: float, rate: float, shards: int, keys_per_shard: int):
+        self.burst = burst
+        self.rate = rate
+        self.keys_per_shard = keys_per_shard
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self.allowed = 0
+        self.rejected = 0
+
+    def _shard(self, key: str) -> OrderedDict:
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def acquire(self, key: str) -> float:
+        """
+        Take one token for key. Returns 0 when allowed, otherwise the number
+        of seconds until a token is available.
+        """
+        now = time.monotonic()
+        shard = self._shard(key)
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = [self.burst, now]
+            shard[key] = bucket
+            if len(shard) > self.keys_per_shard:
+                shard.popitem(last=False)
+        else:
+            shard.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return 0.0
+        self.rejected += 1
+        return (1 - bucket[0]) / self.rate if self.rate > 0 else 60.0
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "tracked_keys": sum(len(shard) for shard in self._shards),
+        }
+
+ip_limiter = TokenBucketLimiter(RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_RATE, RATE_LIMIT_SHARDS, RATE_LIMIT_KEYS_PER_SHARD)
+identity_limiter = TokenBucketLimiter(RATE_LIMIT_IDENTITY_BURST, RATE_LIMIT_IDENTITY_RATE, RATE_LIMIT_SHARDS, RATE_LIMIT_KEYS_PER_SHARD)
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def _too_many_requests(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Too many requests. Please try again later."},
+        headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+    )
+
+def limit_ip(request: Request, scope: str) -> Optional[JSONResponse]:
+    """Return a 429 response if the client IP is over its limit for this route"""
+    retry_after = ip_limiter.acquire(f"{scope}:{client_ip(request)}")
+    return _too_many_requests(retry_after) if retry_after else None
+
+def limit_identities(scope: str, identities: Iterable) -> Optional[JSONResponse]:
+    """Return a 429 response if any targeted email/username is over its limit"""
+    for identity in identities:
+        if isinstance(identity, str) and identity:
+            retry_after = identity_limiter.acquire(f"{scope}:{identity.strip().lower()}")
+            if retry_after:
+                return _too_many_requests(retry_after)
+    return None
+
+def stats() -> dict:
+    return {"ip": ip_limiter.stats(), "identity": identity_limiter.stats()}
@@ -0,0 +1,31 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: while a call for a key is in
+    flight, later callers wait for and share its result instead of
+    starting their own. Nothing is kept once the call completes.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            # Run the call as its own task so a cancelled caller does not cancel it for the others
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+upstream_reads = SingleFlight()
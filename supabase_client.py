@@ -1,6 +1,21 @@
 import os
+import json
+import asyncio
+from typing import AsyncIterator, NamedTuple, Optional
+import bcrypt
 import httpx
 from dotenv import load_dotenv
+from user_cache import get_cached_user, cache_user, invalidate_user, invalidate_for_write
+from upstream_policy import upstream, UPSTREAM_WRITE_TIMEOUT
+from single_flight import upstream_reads
+from user_record import UserRecord, USER_PUBLIC_COLUMNS, USER_AUTH_COLUMNS
+from session_tokens import issue_token
+from availability_index import availability_index
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 load_dotenv()
 
@@ -9,31 +24,232 @@ SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY")
 LOGIN_TABLE = "login"
 USERS_TABLE = "users"
 
+# Connection pool settings for the shared HTTP client. Request timeouts
+# come from the upstream policy (UPSTREAM_*_TIMEOUT); only connecting is limited here.
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Page size cap for keyset pagination and streamed exports
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+USER_LIST_COLUMNS = USER_PUBLIC_COLUMNS
+
+# Batch endpoints: rows per PostgREST request and chunks in flight at once
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+
+# When false, signup relies on the UNIQUE constraints and skips the existence query
+SIGNUP_PRECHECK = os.getenv("SIGNUP_PRECHECK", "false").lower() in ("1", "true", "yes")
+
+# PostgreSQL unique_violation, surfaced by PostgREST with a 409
+UNIQUE_VIOLATION = "23505"
+USER_EXISTS_ERROR = "User with this email or username already exists"
+
 headers = {
     "apikey": SUPABASE_API_KEY,
     "Authorization": f"Bearer {SUPABASE_API_KEY}",
     "Content-Type": "application/json"
 }
 
-async def fetch_login_data():
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}?select=*",
-            headers=headers
+# Ask PostgREST to echo the affected rows so batch calls can report per item
+representation_headers = {**headers, "Prefer": "return=representation"}
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+async def init_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Create the shared pooled client (called from the FastAPI lifespan).
+    A custom transport can be passed to route calls in-process, e.g. to
+    fake_postgrest.app via httpx.ASGITransport.
+    """
+    global _client
+    if transport is not None:
+        await close_http_client()
+        _client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(UPSTREAM_WRITE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT))
+    elif _client is None or _client.is_closed:
+        http2 = SUPABASE_HTTP2 and _http2_available()
+        if SUPABASE_HTTP2 and not http2:
+            print("⚠️  SUPABASE_HTTP2 is set but the 'h2' package is not installed. Using HTTP/1.1.")
+        _client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(UPSTREAM_WRITE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
         )
+    return _client
+
+async def close_http_client():
+    """
+    Close the shared client and release pooled connections (called on shutdown)
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared client, creating it lazily when used outside the app lifespan
+    """
+    if _client is None or _client.is_closed:
+        return await init_http_client()
+    return _client
+
+def _loads(data: bytes):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _dumps_line(row) -> bytes:
+    if orjson:
+        return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(row) + "\n").encode()
+
+class RawPage(NamedTuple):
+    """An upstream JSON body relayed to the client without re-parsing"""
+    content: bytes
+    content_type: str
+    next_cursor: Optional[int]
+
+async def _send(operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client and the upstream policy
+    (timeouts, hedged/retried GETs, circuit breaker), coalescing
+    identical in-flight GETs
+    """
+    client = await get_http_client()
+    if method != "GET":
+        return await upstream.send(client, method, url, operation, **kwargs)
+    # Identical concurrent reads (same URL and projection) share one upstream call
+    key = (url, tuple(sorted((kwargs.get("params") or {}).items())))
+    return await upstream_reads.do(key, lambda: upstream.send(client, method, url, operation, **kwargs))
+
+def _page_size(limit: Optional[int]) -> int:
+    # Listings are always paged, so omitting the limit cannot pull a whole table
+    return MAX_PAGE_SIZE if limit is None else max(1, min(limit, MAX_PAGE_SIZE))
+
+def _keyset_params(select: str, limit: Optional[int], after: Optional[int]) -> dict:
+    """Build PostgREST params for keyset pagination on id"""
+    params = {"select": select, "order": "id.asc", "limit": str(_page_size(limit))}
+    if after is not None:
+        params["id"] = f"gt.{after}"
+    return params
+
+async def _fetch_page(operation: str, table: str, select: str, limit: Optional[int] = None, after: Optional[int] = None):
+    response = await _send(
+        operation, "GET",
+        f"{SUPABASE_URL}/rest/v1/{table}",
+        params=_keyset_params(select, limit, after),
+        headers=headers
+    )
     
     if response.status_code == 200:
-        return response.json()
+        return _loads(response.content)
     else:
         return {"error": f"Status {response.status_code}: {response.text}"}
 
-async def insert_login_data(payload: dict):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}",
-            headers=headers,
-            json=payload
+def _content_range_count(content_range: Optional[str]) -> Optional[int]:
+    """Number of rows in a PostgREST Content-Range header such as '0-49/*'"""
+    if not content_range:
+        return None
+    span = content_range.split("/")[0]
+    if span == "*":
+        return 0
+    start, _, end = span.partition("-")
+    try:
+        return int(end) - int(start) + 1
+    except ValueError:
+        return None
+
+def _next_cursor(response: httpx.Response, limit: Optional[int]) -> Optional[int]:
+    """
+    Id of the last row when the page is full. Only the last object of the
+    body is decoded; the full body is parsed only if that is not possible.
+    """
+    body = response.content
+    count = _content_range_count(response.headers.get("content-range"))
+    if count is None:
+        count = len(_loads(body))
+    if count < _page_size(limit):
+        return None
+    try:
+        last = _loads(body[body.rfind(b"{"):body.rfind(b"}") + 1])
+    except ValueError:
+        last = None
+    if not isinstance(last, dict) or "id" not in last:
+        last = _loads(body)[-1]
+    return last["id"]
+
+async def _fetch_page_raw(operation: str, table: str, select: str, limit: Optional[int] = None, after: Optional[int] = None):
+    response = await _send(
+        operation, "GET",
+        f"{SUPABASE_URL}/rest/v1/{table}",
+        params=_keyset_params(select, limit, after),
+        headers=headers
+    )
+    
+    if response.status_code == 200:
+        return RawPage(
+            response.content,
+            response.headers.get("content-type", "application/json"),
+            _next_cursor(response, limit)
         )
+    else:
+        return {"error": f"Status {response.status_code}: {response.text}"}
+
+async def _stream_rows(operation: str, table: str, select: str, after: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Yield every row after the given id as NDJSON lines, one page at a time,
+    so at most MAX_PAGE_SIZE rows are held in memory
+    """
+    while True:
+        rows = await _fetch_page(operation, table, select, limit=MAX_PAGE_SIZE, after=after)
+        if isinstance(rows, dict):
+            yield _dumps_line(rows)
+            return
+        for row in rows:
+            yield _dumps_line(row)
+        if len(rows) < MAX_PAGE_SIZE:
+            return
+        after = rows[-1]["id"]
+
+async def fetch_login_data(limit: Optional[int] = None, after: Optional[int] = None):
+    """
+    Fetch one keyset page (ordered by id) of login rows, MAX_PAGE_SIZE
+    rows when no limit is given
+    """
+    return await _fetch_page("fetch_login_data", LOGIN_TABLE, "*", limit, after)
+
+async def fetch_login_data_raw(limit: Optional[int] = None, after: Optional[int] = None):
+    """
+    Like fetch_login_data, but returns the upstream body as a RawPage
+    """
+    return await _fetch_page_raw("fetch_login_data", LOGIN_TABLE, "*", limit, after)
+
+def stream_login_data(after: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Stream login rows as NDJSON without buffering the whole table
+    """
+    return _stream_rows("stream_login_data", LOGIN_TABLE, "*", after)
+
+async def insert_login_data(payload: dict):
+    response = await _send(
+        "insert_login_data", "POST",
+        f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}",
+        headers=headers,
+        json=payload
+    )
     
     if response.status_code in [200, 201]:
         try:
@@ -46,11 +262,13 @@ async def insert_login_data(payload: dict):
 async def delete_login_data(condition: dict):
     # Example: {"email": "test@example.com"}
     query_str = "&".join([f"{key}=eq.{value}" for key, value in condition.items()])
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(
-            f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}?{query_str}",
-            headers=headers
-        )
+    response = await _send(
+        "delete_login_data", "DELETE",
+        f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}?{query_str}",
+        headers=headers
+    )
+    invalidate_for_write(condition)
+    availability_index.discard()
     
     if response.status_code in [200, 204]:
         try:
@@ -64,12 +282,14 @@ async def update_login_data(condition: dict, payload: dict):
     # Example condition: {"email": "test@example.com"}
     # Example payload: {"password": "newpassword"}
     query_str = "&".join([f"{key}=eq.{value}" for key, value in condition.items()])
-    async with httpx.AsyncClient() as client:
-        response = await client.patch(
-            f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}?{query_str}",
-            headers=headers,
-            json=payload
-        )
+    response = await _send(
+        "update_login_data", "PATCH",
+        f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}?{query_str}",
+        headers=headers,
+        json=payload
+    )
+    invalidate_for_write(condition, payload)
+    _index_update(payload)
     
     if response.status_code in [200, 204]:
         try:
@@ -79,15 +299,174 @@ async def update_login_data(condition: dict, payload: dict):
     else:
         return {"error": f"Status {response.status_code}: {response.text}"}
 
-async def signup_user(user_data: dict):
+def _index_update(payload: dict):
+    """Keep the availability index in step with a login row update"""
+    if payload.get("email") or payload.get("username"):
+        availability_index.add(payload.get("email"), payload.get("username"))
+        # The old values may be free now; the next rebuild drops them
+        availability_index.discard()
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+async def _run_chunks(jobs: list) -> list:
+    """Run chunk coroutines with at most BULK_CONCURRENCY in flight"""
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def bounded(job):
+        async with semaphore:
+            return await job
+
+    return await asyncio.gather(*(bounded(job) for job in jobs))
+
+def _summarize(results: list) -> dict:
+    failed = sum(1 for result in results if "error" in result)
+    return {"succeeded": len(results) - failed, "failed": failed, "results": results}
+
+async def bulk_insert_login_data(records: list):
+    """
+    Insert many login rows using chunked PostgREST bulk inserts.
+    A failed chunk marks each of its rows as failed.
+    """
+    results = [None] * len(records)
+
+    async def insert_chunk(start: int, chunk: list):
+        response = await _send(
+            "bulk_insert_login_data", "POST",
+            f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}",
+            headers=representation_headers,
+            json=chunk
+        )
+        if response.status_code in [200, 201]:
+            try:
+                rows = response.json()
+            except ValueError:
+                rows = [None] * len(chunk)
+            for offset, row in enumerate(rows):
+                results[start + offset] = {"index": start + offset, "status": "inserted", "data": row}
+        else:
+            error = f"Status {response.status_code}: {response.text}"
+            for offset in range(len(chunk)):
+                results[start + offset] = {"index": start + offset, "error": error}
+
+    await _run_chunks([insert_chunk(start, chunk) for start, chunk in _chunks(records, BULK_CHUNK_SIZE)])
+    return _summarize(results)
+
+async def _apply_filtered(method: str, key: str, indexed: list, payload: Optional[dict], done_status: str, results: list):
+    """
+    Apply one PATCH/DELETE per chunk with a key=in.(...) filter and map the
+    returned rows back to the requested items
+    """
+    async def apply_chunk(chunk: list):
+        values = ",".join(_pg_quote(value) for _, value in chunk)
+        response = await _send(
+            f"bulk_{method.lower()}_login_data", method,
+            f"{SUPABASE_URL}/rest/v1/{LOGIN_TABLE}",
+            params={key: f"in.({values})"},
+            headers=representation_headers,
+            json=payload
+        )
+        for _, value in chunk:
+            invalidate_for_write({key: value}, payload)
+        if payload is None:
+            availability_index.discard(len(chunk))
+        else:
+            _index_update(payload)
+        if response.status_code in [200, 204]:
+            try:
+                touched = {str(row.get(key)) for row in response.json()}
+            except ValueError:
+                touched = None
+            for index, value in chunk:
+                if touched is None or str(value) in touched:
+                    results[index] = {"index": index, "status": done_status}
+                else:
+                    results[index] = {"index": index, "error": "No matching row"}
+        else:
+            error = f"Status {response.status_code}: {response.text}"
+            for index, _ in chunk:
+                results[index] = {"index": index, "error": error}
+
+    return [apply_chunk(chunk) for _, chunk in _chunks(indexed, BULK_CHUNK_SIZE)]
+
+async def bulk_update_login_data(items: list, key: str = "email"):
+    """
+    Update many login rows. Each item holds the key field plus the columns to
+    change; items with identical changes share one key=in.(...) PATCH per chunk.
+    """
+    results = [None] * len(items)
+    groups = {}
+    for index, item in enumerate(items):
+        if not item.get(key):
+            results[index] = {"index": index, "error": f"Missing '{key}'"}
+            continue
+        payload = {k: v for k, v in item.items() if k != key}
+        if not payload:
+            results[index] = {"index": index, "error": "Nothing to update"}
+            continue
+        group_key = json.dumps(payload, sort_keys=True, default=str)
+        groups.setdefault(group_key, (payload, []))[1].append((index, item[key]))
+
+    jobs = []
+    for payload, indexed in groups.values():
+        jobs += await _apply_filtered("PATCH", key, indexed, payload, "updated", results)
+    await _run_chunks(jobs)
+    return _summarize(results)
+
+async def bulk_delete_login_data(conditions: list):
+    """
+    Delete many login rows. Each condition names a single field, e.g.
+    {"email": "test@example.com"}; conditions on the same field share one
+    field=in.(...) DELETE per chunk.
+    """
+    results = [None] * len(conditions)
+    groups = {}
+    for index, condition in enumerate(conditions):
+        if len(condition) != 1:
+            results[index] = {"index": index, "error": "Each condition must have exactly one field"}
+            continue
+        (key, value), = condition.items()
+        groups.setdefault(key, []).append((index, value))
+
+    jobs = []
+    for key, indexed in groups.items():
+        jobs += await _apply_filtered("DELETE", key, indexed, None, "deleted", results)
+    await _run_chunks(jobs)
+    return _summarize(results)
+
+def _pg_quote(value) -> str:
+    """Quote a value for use inside a PostgREST or=(...) filter"""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+def _is_unique_violation(response: httpx.Response) -> bool:
+    """Check whether a failed insert was rejected by a UNIQUE constraint"""
+    if response.status_code != 409:
+        return False
+    try:
+        return response.json().get("code") == UNIQUE_VIOLATION
+    except Exception:
+        # Older PostgREST versions only send the status code
+        return True
+
+async def signup_user(user_data: dict, precheck: Optional[bool] = None):
     """
     Register a new user with all signup form fields
     Expected fields: fullName, username, email, password, phoneNumber
+
+    By default this is a single conflict-aware insert: duplicates are rejected
+    by the UNIQUE constraints on email/username. Pass precheck=True (or set
+    SIGNUP_PRECHECK) to run one existence query before inserting.
     """
+    if precheck is None:
+        precheck = SIGNUP_PRECHECK
+
     # Check if user already exists
-    existing_user = await check_user_exists(user_data["email"], user_data["username"])
-    if existing_user:
-        return {"error": "User with this email or username already exists"}
+    if precheck:
+        existing_user = await check_user_exists(user_data["email"], user_data["username"])
+        if existing_user:
+            return {"error": USER_EXISTS_ERROR}
     
     # Prepare user data for database
     user_payload = {
@@ -100,16 +479,21 @@ async def signup_user(user_data: dict):
         "is_active": True
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}",
-            headers=headers,
-            json=user_payload
-        )
+    response = await _send(
+        "signup_user", "POST",
+        f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}",
+        # Echo the new row, projected to the public columns (never the password)
+        params={"select": USER_PUBLIC_COLUMNS},
+        headers=representation_headers,
+        json=user_payload
+    )
+    invalidate_user(user_payload["email"], user_payload["username"])
+    if response.status_code in [200, 201] or _is_unique_violation(response):
+        availability_index.add(user_payload["email"], user_payload["username"])
     
     if response.status_code in [200, 201]:
         try:
-            user_result = response.json()
+            user_result = [UserRecord.from_row(row).to_dict() for row in _loads(response.content)]
             return {
                 "success": "User registered successfully", 
                 "status": response.status_code,
@@ -120,6 +504,8 @@ async def signup_user(user_data: dict):
                 "success": "User registered successfully", 
                 "status": response.status_code
             }
+    elif _is_unique_violation(response):
+        return {"error": USER_EXISTS_ERROR}
     else:
         return {"error": f"Status {response.status_code}: {response.text}"}
 
@@ -127,40 +513,117 @@ async def check_user_exists(email: str, username: str):
     """
     Check if a user with the given email or username already exists
     """
-    async with httpx.AsyncClient() as client:
-        # Check email
-        email_response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?email=eq.{email}&select=id",
-            headers=headers
-        )
-        
-        # Check username
-        username_response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?username=eq.{username}&select=id",
-            headers=headers
-        )
-    
-    if email_response.status_code == 200 and email_response.json():
-        return True
-    if username_response.status_code == 200 and username_response.json():
+    if get_cached_user("email", email) or get_cached_user("username", username):
         return True
+    # Neither value is in the availability index, so both are definitely free
+    local = not (availability_index.might_contain("email", email) or availability_index.might_contain("username", username))
+    availability_index.record_lookup(local)
+    if local:
+        return False
+    
+    # Check email and username in a single query
+    response = await _send(
+        "check_user_exists", "GET",
+        f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}",
+        params={
+            "or": f"(email.eq.{_pg_quote(email)},username.eq.{_pg_quote(username)})",
+            "select": USER_AUTH_COLUMNS,
+            "limit": "1",
+        },
+        headers=headers
+    )
+    
+    if response.status_code == 200:
+        users = _loads(response.content)
+        if users:
+            cache_user(UserRecord.from_row(users[0]))
+            return True
     
     return False
 
-async def fetch_users():
+async def check_availability(email: Optional[str] = None, username: Optional[str] = None):
     """
-    Fetch all users from the database (for testing purposes)
+    Report whether an email and/or username is free. Values missing from the
+    availability index are answered locally; possible collisions are
+    confirmed with one upstream query.
     """
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?select=id,full_name,username,email,phone_number,role,is_active,created_at",
+    requested = {field: value for field, value in (("email", email), ("username", username)) if value}
+    if not requested:
+        return {"error": "Provide an email and/or username"}
+
+    result = {}
+    uncertain = {}
+    for field, value in requested.items():
+        if availability_index.might_contain(field, value):
+            uncertain[field] = value
+        else:
+            result[field] = True
+    availability_index.record_lookup(not uncertain)
+
+    if uncertain:
+        filters = ",".join(f"{field}.eq.{_pg_quote(value)}" for field, value in uncertain.items())
+        response = await _send(
+            "check_availability", "GET",
+            f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}",
+            params={"or": f"({filters})", "select": "email,username", "limit": str(len(uncertain))},
             headers=headers
         )
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return {"error": f"Status {response.status_code}: {response.text}"}
+        if response.status_code != 200:
+            return {"error": f"Status {response.status_code}: {response.text}"}
+        rows = _loads(response.content)
+        for field, value in uncertain.items():
+            result[field] = not any(row.get(field) == value for row in rows)
+
+    result["available"] = all(result[field] for field in requested)
+    return result
+
+async def iter_user_identities() -> AsyncIterator[tuple]:
+    """
+    Yield (email, username) for every user, one keyset page at a time.
+    Used to load the availability index.
+    """
+    after = None
+    while True:
+        rows = await _fetch_page("iter_user_identities", USERS_TABLE, "id,email,username", limit=MAX_PAGE_SIZE, after=after)
+        if isinstance(rows, dict):
+            raise RuntimeError(rows["error"])
+        for row in rows:
+            yield row.get("email"), row.get("username")
+        if len(rows) < MAX_PAGE_SIZE:
+            return
+        after = rows[-1]["id"]
+
+async def fetch_users(limit: Optional[int] = None, after: Optional[int] = None):
+    """
+    Fetch users from the database (for testing purposes), one keyset page
+    (ordered by id) at a time, MAX_PAGE_SIZE rows when no limit is given
+    """
+    return await _fetch_page("fetch_users", USERS_TABLE, USER_LIST_COLUMNS, limit, after)
+
+async def fetch_users_raw(limit: Optional[int] = None, after: Optional[int] = None):
+    """
+    Like fetch_users, but returns the upstream body as a RawPage
+    """
+    return await _fetch_page_raw("fetch_users", USERS_TABLE, USER_LIST_COLUMNS, limit, after)
+
+def stream_users(after: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Stream users as NDJSON without buffering the whole table
+    """
+    return _stream_rows("stream_users", USERS_TABLE, USER_LIST_COLUMNS, after)
+
+async def _password_matches(stored: Optional[str], password: str) -> bool:
+    """
+    Rows written by the bulk importer hold bcrypt hashes; accounts created
+    through signup still store the password as given
+    """
+    if stored and stored.startswith("$2"):
+        try:
+            # bcrypt is deliberately slow; keep it off the event loop
+            return await asyncio.to_thread(bcrypt.checkpw, password.encode(), stored.encode())
+        except ValueError:
+            return False
+    return stored == password
 
 async def login_user(login_data: dict):
     """
@@ -181,44 +644,38 @@ async def login_user(login_data: dict):
         # It's a username
         query_field = "username"
     
-    async with httpx.AsyncClient() as client:
+    user = get_cached_user(query_field, email_or_username)
+    if user is None:
         # Fetch user by email or username
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?{query_field}=eq.{email_or_username}&select=*",
+        response = await _send(
+            "login_user", "GET",
+            f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?{query_field}=eq.{email_or_username}&select={USER_AUTH_COLUMNS}",
             headers=headers
         )
+        
+        if response.status_code != 200:
+            return {"error": f"Database error: {response.status_code}"}
+        
+        users = _loads(response.content)
+        
+        if not users:
+            return {"error": "Invalid email/username or password"}
+        
+        user = UserRecord.from_row(users[0])  # Get the first (and should be only) user
+        cache_user(user)
     
-    if response.status_code != 200:
-        return {"error": f"Database error: {response.status_code}"}
-    
-    users = response.json()
-    
-    if not users:
-        return {"error": "Invalid email/username or password"}
-    
-    user = users[0]  # Get the first (and should be only) user
-    
-    # Verify password (in production, this should use hashed password comparison)
-    if user["password"] != password:
+    if not await _password_matches(user.password, password):
         return {"error": "Invalid email/username or password"}
     
     # Check if user is active
-    if not user.get("is_active", True):
+    if user.is_active is False:
         return {"error": "Account is deactivated. Please contact support."}
     
     # Return user data (excluding password)
-    user_data = {
-        "id": user["id"],
-        "username": user["username"],
-        "email": user["email"],
-        "full_name": user["full_name"],
-        "phone_number": user["phone_number"],
-        "role": user["role"],
-        "created_at": user["created_at"]
-    }
+    user_data = user.to_dict(exclude=("password", "is_active"))
     
     return {
         "success": "Login successful",
         "user": user_data,
-        "token": f"user_{user['id']}_token"  # Simple token for demo (use JWT in production)
+        "token": issue_token(user.id, user.role, user.username)
     }
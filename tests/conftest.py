@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The API modules live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# session_tokens refuses to start without a private secret
+os.environ.setdefault("SESSION_SECRET", "test-session-secret")
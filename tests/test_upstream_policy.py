@@ -0,0 +1,237 @@
+import asyncio
+import httpx
+import pytest
+import upstream_policy
+from upstream_policy import CircuitBreaker, UpstreamPolicy
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(upstream_policy, "time", clock)
+    return clock
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(upstream_policy, "UPSTREAM_BACKOFF_BASE_MS", 0)
+    monkeypatch.setattr(upstream_policy, "UPSTREAM_BACKOFF_MAX_MS", 0)
+
+def make_policy(retries=2, hedge_delay=0.0, **breaker):
+    options = {"failure_rate": 0.5, "min_requests": 4, "window": 30, "cooldown": 10}
+    options.update(breaker)
+    policy = UpstreamPolicy(CircuitBreaker(**options))
+    policy.retries = retries
+    policy.hedge_delay = hedge_delay
+    return policy
+
+def send(policy, handler, method="GET", operation="fetch_users"):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), timeout=httpx.Timeout(10, connect=5)) as client:
+            return await policy.send(client, method, "http://upstream/rest/v1/users", operation)
+    return asyncio.run(run())
+
+# Circuit breaker
+
+def test_breaker_stays_closed_below_min_requests(clock):
+    breaker = CircuitBreaker(0.5, 4, 30, 10)
+    for _ in range(3):
+        breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_breaker_opens_at_failure_rate(clock):
+    breaker = CircuitBreaker(0.5, 4, 30, 10)
+    for failed in (False, True, False, True):
+        breaker.record(failed)
+    assert breaker.state == "open"
+    assert breaker.times_opened == 1
+    assert not breaker.allow()
+
+def test_breaker_forgets_outcomes_outside_window(clock):
+    breaker = CircuitBreaker(0.5, 4, 30, 10)
+    for _ in range(3):
+        breaker.record(True)
+    clock.now += 31
+    breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.stats()["window_requests"] == 1
+
+def test_breaker_half_open_allows_one_probe(clock):
+    breaker = CircuitBreaker(0.5, 1, 30, 10)
+    breaker.record(True)
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+def test_breaker_probe_success_closes(clock):
+    breaker = CircuitBreaker(0.5, 1, 30, 10)
+    breaker.record(True)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_breaker_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(0.5, 1, 30, 10)
+    breaker.record(True)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+    assert not breaker.allow()
+
+def test_breaker_release_frees_the_probe(clock):
+    breaker = CircuitBreaker(0.5, 1, 30, 10)
+    breaker.record(True)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+# Upstream policy
+
+def test_get_is_retried_on_503():
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) < 3 else 200, json=[])
+    policy = make_policy(min_requests=100)
+    response = send(policy, handler)
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert policy.counters["retries"] == 2
+
+def test_post_is_not_retried():
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+    response = send(make_policy(min_requests=100), handler, method="POST", operation="signup_user")
+    assert response.status_code == 503
+    assert len(calls) == 1
+
+def test_client_errors_are_returned_and_count_as_healthy():
+    policy = make_policy(min_requests=1)
+    response = send(policy, lambda request: httpx.Response(409))
+    assert response.status_code == 409
+    assert policy.breaker.state == "closed"
+
+def test_timeouts_become_a_synthetic_504():
+    def handler(request):
+        raise httpx.ReadTimeout("slow", request=request)
+    policy = make_policy(retries=1, min_requests=100)
+    response = send(policy, handler)
+    assert response.status_code == 504
+    assert policy.counters["timeouts"] == 2
+
+def test_open_breaker_short_circuits_without_calling_upstream():
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500)
+    policy = make_policy(retries=0, min_requests=2)
+    send(policy, handler)
+    send(policy, handler)
+    assert policy.breaker.state == "open"
+    response = send(policy, handler)
+    assert response.status_code == 503
+    assert len(calls) == 2
+    assert policy.counters["short_circuited"] == 1
+
+def test_operation_timeout_keeps_client_connect_timeout():
+    seen = {}
+    def handler(request):
+        seen.update(request.extensions["timeout"])
+        return httpx.Response(200, json=[])
+    policy = make_policy()
+    policy.timeouts = {"fetch_users": 2.5}
+    send(policy, handler)
+    assert seen == {"connect": 5, "read": 2.5, "write": 2.5, "pool": 2.5}
+
+# Hedging
+
+def test_fast_response_is_not_hedged():
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json=[])
+    policy = make_policy(hedge_delay=0.05)
+    assert send(policy, handler).status_code == 200
+    assert len(calls) == 1
+    assert policy.counters["hedged"] == 0
+
+def test_slow_primary_is_hedged_and_hedge_wins():
+    calls = []
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+            return httpx.Response(200, json=["primary"])
+        return httpx.Response(200, json=["hedge"])
+    policy = make_policy(hedge_delay=0.02)
+    response = send(policy, handler)
+    assert response.json() == ["hedge"]
+    assert policy.counters["hedged"] == 1
+    assert policy.counters["hedge_wins"] == 1
+
+def test_hedge_failure_falls_back_to_primary():
+    calls = []
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(0.1)
+            return httpx.Response(200, json=["primary"])
+        return httpx.Response(500)
+    policy = make_policy(hedge_delay=0.02, min_requests=100)
+    response = send(policy, handler)
+    assert response.json() == ["primary"]
+    assert policy.counters["hedge_wins"] == 0
+
+# Probes that end without an outcome
+
+def open_breaker(clock):
+    policy = make_policy(retries=0, min_requests=1)
+    send(policy, lambda request: httpx.Response(500))
+    assert policy.breaker.state == "open"
+    clock.now += 10
+    return policy
+
+def test_cancelled_probe_lets_the_next_request_probe(clock):
+    policy = open_breaker(clock)
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=[])
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            probe = asyncio.ensure_future(policy.send(client, "GET", "http://upstream/rest/v1/users", "fetch_users"))
+            await asyncio.sleep(0.01)
+            assert policy.breaker.probe_in_flight
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+    asyncio.run(run())
+    assert not policy.breaker.probe_in_flight
+    assert send(policy, lambda request: httpx.Response(200, json=[])).status_code == 200
+    assert policy.breaker.state == "closed"
+
+def test_probe_raising_unexpectedly_lets_the_next_request_probe(clock):
+    policy = open_breaker(clock)
+    def handler(request):
+        raise RuntimeError("bug in a hook")
+    with pytest.raises(RuntimeError):
+        send(policy, handler)
+    assert policy.breaker.state == "half_open"
+    assert send(policy, lambda request: httpx.Response(200, json=[])).status_code == 200
+    assert policy.breaker.state == "closed"
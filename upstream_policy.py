@@ -0,0 +1,219 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Optional
+import httpx
+
+# Default per-attempt timeouts (seconds) for reads and writes
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "3"))
+UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "10"))
+# Per-operation overrides, e.g. "login_user=2,fetch_users=5"
+UPSTREAM_TIMEOUTS = os.getenv("UPSTREAM_TIMEOUTS", "")
+
+# Send a duplicate GET when the first has not answered after this delay (0 disables)
+UPSTREAM_HEDGE_DELAY_MS = float(os.getenv("UPSTREAM_HEDGE_DELAY_MS", "150"))
+
+# Retries for safe (GET) requests, with full-jitter exponential backoff
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE_MS = float(os.getenv("UPSTREAM_BACKOFF_BASE_MS", "50"))
+UPSTREAM_BACKOFF_MAX_MS = float(os.getenv("UPSTREAM_BACKOFF_MAX_MS", "1000"))
+
+# Circuit breaker: open when the failure rate over the window crosses the threshold
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "20"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "30"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "15"))
+
+SAFE_METHODS = ("GET", "HEAD")
+
+def _parse_timeouts(spec: str) -> dict:
+    timeouts = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            timeouts[name.strip()] = float(value)
+    return timeouts
+
+def _is_failure(response: Optional[httpx.Response]) -> bool:
+    # 4xx answers (conflicts, bad filters) mean the upstream is healthy
+    return response is None or response.status_code >= 500
+
+def _synthetic_response(status_code: int, message: str) -> httpx.Response:
+    return httpx.Response(status_code, json={"code": "UPSTREAM", "message": message})
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker: closed -> open when the failure rate crosses the
+    threshold, open -> half-open after the cooldown, and a single probe
+    request decides whether to close again.
+    """
+
+    def __init__(self, failure_rate: float, min_requests: int, window: float, cooldown: float):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self._outcomes = deque()
+        self._failures = 0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+            self.probe_in_flight = False
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+
+    def release(self):
+        """Give up a probe that ended without an outcome, so the next request can probe"""
+        if self.state == "half_open":
+            self.probe_in_flight = False
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        if self.state == "half_open":
+            self.probe_in_flight = False
+            if failed:
+                self._open(now)
+            else:
+                self._reset("closed")
+            return
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, old_failed = self._outcomes.popleft()
+            self._failures -= old_failed
+        total = len(self._outcomes)
+        if total >= self.min_requests and self._failures / total >= self.failure_rate:
+            self._open(now)
+
+    def _open(self, now: float):
+        self._reset("open")
+        self.opened_at = now
+        self.times_opened += 1
+
+    def _reset(self, state: str):
+        self.state = state
+        self._outcomes.clear()
+        self._failures = 0
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "times_opened": self.times_opened,
+            "window_requests": len(self._outcomes),
+            "window_failures": self._failures,
+        }
+
+class UpstreamPolicy:
+    """
+    Timeouts, hedging, retries and circuit breaking around httpx calls.
+    Always returns a response: when the breaker is open or every attempt
+    fails, a synthetic 503/504 is returned so callers keep their usual
+    status-code handling.
+    """
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.timeouts = _parse_timeouts(UPSTREAM_TIMEOUTS)
+        self.hedge_delay = UPSTREAM_HEDGE_DELAY_MS / 1000
+        self.retries = UPSTREAM_RETRIES
+        self.counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "retries": 0, "short_circuited": 0, "timeouts": 0}
+
+    def timeout_for(self, operation: str, method: str) -> float:
+        if operation in self.timeouts:
+            return self.timeouts[operation]
+        return UPSTREAM_READ_TIMEOUT if method in SAFE_METHODS else UPSTREAM_WRITE_TIMEOUT
+
+    async def send(self, client: httpx.AsyncClient, method: str, url: str, operation: str, **kwargs) -> httpx.Response:
+        self.counters["requests"] += 1
+        # The operation timeout bounds read, write and pool waits; connecting keeps the client's own limit
+        kwargs.setdefault("timeout", httpx.Timeout(self.timeout_for(operation, method), connect=client.timeout.connect))
+        safe = method in SAFE_METHODS
+        attempts = 1 + (self.retries if safe else 0)
+
+        response, error = None, None
+        for attempt in range(attempts):
+            if attempt:
+                self.counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+            if not self.breaker.allow():
+                self.counters["short_circuited"] += 1
+                return _synthetic_response(503, f"Upstream circuit open for {operation}")
+            try:
+                if safe and self.hedge_delay > 0:
+                    response = await self._hedged(client, method, url, kwargs)
+                else:
+                    response = await client.request(method, url, **kwargs)
+                error = None
+            except httpx.TimeoutException as e:
+                self.counters["timeouts"] += 1
+                response, error = None, e
+            except httpx.TransportError as e:
+                response, error = None, e
+            except BaseException:
+                # Cancelled, or failed outside the transport: no verdict on the upstream
+                self.breaker.release()
+                raise
+            self.breaker.record(_is_failure(response))
+            retryable = response is None or response.status_code in (502, 503, 504)
+            if not retryable:
+                return response
+
+        if response is not None:
+            return response
+        status_code = 504 if isinstance(error, httpx.TimeoutException) else 502
+        return _synthetic_response(status_code, f"Upstream {operation} failed: {error!r}")
+
+    def _backoff(self, attempt: int) -> float:
+        cap = min(UPSTREAM_BACKOFF_MAX_MS, UPSTREAM_BACKOFF_BASE_MS * (2 ** attempt))
+        return random.uniform(0, cap) / 1000
+
+    async def _hedged(self, client: httpx.AsyncClient, method: str, url: str, kwargs: dict) -> httpx.Response:
+        """
+        Start the request, and if it has not finished after hedge_delay start
+        an identical one; the first healthy answer wins and the other is cancelled
+        """
+        primary = asyncio.ensure_future(client.request(method, url, **kwargs))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay)
+            if done:
+                return primary.result()
+
+            self.counters["hedged"] += 1
+            hedge = asyncio.ensure_future(client.request(method, url, **kwargs))
+            pending.add(hedge)
+            fallback, error = None, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if not _is_failure(task.result()):
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    fallback = task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        if fallback is not None:
+            return fallback
+        raise error
+
+    def stats(self) -> dict:
+        return {**self.counters, "breaker": self.breaker.stats()}
+
+upstream = UpstreamPolicy(CircuitBreaker(BREAKER_FAILURE_RATE, BREAKER_MIN_REQUESTS, BREAKER_WINDOW, BREAKER_COOLDOWN))
@@ -0,0 +1,109 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from user_record import UserRecord
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire after a fixed TTL
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        return entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+# User records keyed by ("email", value) and ("username", value)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def get_cached_user(field: str, value: str) -> Optional[UserRecord]:
+    return user_cache.get((field, value))
+
+def cache_user(user: UserRecord):
+    """Store a user record under both its email and username"""
+    for field in ("email", "username"):
+        if getattr(user, field):
+            user_cache.set((field, getattr(user, field)), user)
+
+def invalidate_user(email: Optional[str] = None, username: Optional[str] = None):
+    """
+    Drop a user from the cache, including the entry stored under the
+    other key of the same row
+    """
+    for field, value in (("email", email), ("username", username)):
+        if not value:
+            continue
+        user = user_cache.pop((field, value))
+        if user:
+            for other in ("email", "username"):
+                if getattr(user, other):
+                    user_cache.pop((other, getattr(user, other)))
+
+def invalidate_for_write(condition: dict, payload: Optional[dict] = None):
+    """
+    Invalidate users touched by a write. If the condition does not name an
+    email or username we cannot tell which rows changed, so clear everything.
+    """
+    if not (condition.get("email") or condition.get("username")):
+        user_cache.clear()
+        return
+    invalidate_user(condition.get("email"), condition.get("username"))
+    if payload:
+        invalidate_user(payload.get("email"), payload.get("username"))
@@ -0,0 +1,28 @@
+from typing import NamedTuple, Optional
+
+class UserRecord(NamedTuple):
+    """
+    Immutable, dict-free user row shared by the login, signup and listing paths
+    """
+    id: int
+    full_name: str
+    username: str
+    email: str
+    phone_number: Optional[str]
+    role: str
+    is_active: bool
+    created_at: Optional[str]
+    # Only selected for credential checks, never returned to clients
+    password: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> "UserRecord":
+        return cls._make(row.get(field) for field in cls._fields)
+
+    def to_dict(self, exclude=("password",)) -> dict:
+        return {field: value for field, value in zip(self._fields, self) if field not in exclude}
+
+# PostgREST select= projections derived from the record
+USER_PUBLIC_FIELDS = tuple(field for field in UserRecord._fields if field != "password")
+USER_PUBLIC_COLUMNS = ",".join(USER_PUBLIC_FIELDS)
+USER_AUTH_COLUMNS = ",".join(UserRecord._fields)